@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the expansion of DailySlotTimePattern objects into slot times:
+the per day and per slot datetime loop formerly used by
+SlotTimesGeneration.create_slot_times against nowait.core.expand_slot_times.
+
+The booking type has 30 patterns (6 for every day from monday to friday)
+and slot times of 15 minutes, expanded over 365 days.
+
+Run it from the root of the repository with::
+
+    python benchmarks/bench_slot_expansion.py
+"""
+from __future__ import print_function, unicode_literals
+
+import datetime
+import os
+import sys
+import timeit
+
+import pytz
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from nowait.core import (expand_slot_times, get_range_days,  # noqa
+                         get_week_map_by_weekday)
+
+TIMEZONE = pytz.timezone('Europe/Rome')
+SLOT_LENGTH = 15
+START_DATE = datetime.date(2014, 1, 1)
+END_DATE = START_DATE + datetime.timedelta(days=364)
+PATTERNS = [(day, datetime.time(hour), datetime.time(hour, 50))
+            for day in range(0, 5) for hour in range(8, 14)]
+REPEAT = 5
+
+
+def loop_expansion():
+    days = get_week_map_by_weekday(get_range_days(START_DATE, END_DATE))
+    slots = []
+    for weekday, start_time, end_time in PATTERNS:
+        for day in days[str(weekday)]:
+            cache_start_datetime = TIMEZONE.localize(
+                datetime.datetime.combine(day, start_time))
+            end_datetime = TIMEZONE.localize(
+                datetime.datetime.combine(day, end_time))
+            while (((end_datetime - cache_start_datetime).seconds / 60)
+                    >= SLOT_LENGTH):
+                end_slot = cache_start_datetime + datetime.timedelta(
+                    minutes=SLOT_LENGTH)
+                slots.append((cache_start_datetime, end_slot))
+                cache_start_datetime = end_slot
+    return slots
+
+
+def kernel_expansion():
+    return expand_slot_times(PATTERNS, SLOT_LENGTH, START_DATE, END_DATE,
+                             TIMEZONE)
+
+
+def main():
+    n_slots = len(kernel_expansion().starts)
+    assert n_slots == len(loop_expansion())
+    print('{0} slot times from {1} patterns over 365 days'.format(
+        n_slots, len(PATTERNS)))
+    for name, func in [('datetime loop', loop_expansion),
+                       ('expand_slot_times', kernel_expansion)]:
+        best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+        print('{0:<20} {1:8.2f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
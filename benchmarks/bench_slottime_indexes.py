@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the query plans of the hot SlotTime and Booking queries
+before and after the indexes of migration 0005:
+
+* FreeSlotTimeManager.get_for_booking: free slot times of a booking type
+  between two datetimes, ordered by start;
+* BookingListView: bookings of a booker ordered by created.
+
+The tables are created in a scratch schema of a PostgreSQL database and
+filled with ROWS slot times (200 booking types, one slot time every 15
+minutes, 10% of them taken). Nothing outside of the scratch schema is
+touched.
+
+Run it from the root of the repository with::
+
+    NOWAIT_BENCH_DSN="dbname=nowait_bench" python \\
+        benchmarks/bench_slottime_indexes.py [ROWS]
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+
+import psycopg2
+
+DSN = os.environ.get('NOWAIT_BENCH_DSN', 'dbname=nowait_bench')
+SCHEMA = 'nowait_bench'
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 3000000
+BOOKING_TYPES = 200
+
+SETUP = """
+DROP SCHEMA IF EXISTS {schema} CASCADE;
+CREATE SCHEMA {schema};
+SET search_path TO {schema};
+CREATE TABLE nowait_slottime (
+    id serial PRIMARY KEY,
+    booking_type_id integer NOT NULL,
+    start timestamp with time zone NOT NULL,
+    "end" timestamp with time zone NOT NULL,
+    status varchar(100) NOT NULL);
+INSERT INTO nowait_slottime (booking_type_id, start, "end", status)
+    SELECT n % {booking_types},
+           '2014-01-01'::timestamptz + (n / {booking_types}) * interval
+           '15 minutes',
+           '2014-01-01'::timestamptz + (n / {booking_types} + 1) * interval
+           '15 minutes',
+           CASE WHEN n % 10 = 0 THEN 'taken' ELSE 'free' END
+    FROM generate_series(0, {rows} - 1) AS n;
+CREATE INDEX nowait_slottime_booking_type_id
+    ON nowait_slottime (booking_type_id);
+CREATE TABLE nowait_booking (
+    id serial PRIMARY KEY,
+    booker_id integer NOT NULL,
+    slottime_id integer NOT NULL UNIQUE,
+    created timestamp with time zone NOT NULL);
+INSERT INTO nowait_booking (booker_id, slottime_id, created)
+    SELECT id % 5000, id, start - interval '3 days'
+    FROM nowait_slottime WHERE status = 'taken';
+CREATE INDEX nowait_booking_booker_id ON nowait_booking (booker_id);
+ANALYZE;
+"""
+
+INDEXES = """
+SET search_path TO {schema};
+CREATE INDEX nowait_slottime_booking_type_id_start
+    ON nowait_slottime (booking_type_id, start);
+CREATE INDEX nowait_slottime_free_booking_type_id_start
+    ON nowait_slottime (booking_type_id, start) WHERE status = 'free';
+CREATE INDEX nowait_booking_booker_id_created
+    ON nowait_booking (booker_id, created);
+ANALYZE;
+"""
+
+QUERIES = [
+    ('get_for_booking',
+     "SELECT id, start, \"end\" FROM nowait_slottime"
+     " WHERE status = 'free' AND booking_type_id = 42"
+     " AND start > '2014-03-01' AND \"end\" < '2014-06-04'"
+     " ORDER BY start"),
+    ('booking list',
+     "SELECT * FROM nowait_booking WHERE booker_id = 42 ORDER BY created"),
+]
+
+
+def explain(cursor):
+    for name, query in QUERIES:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query)
+        plan = [row[0] for row in cursor.fetchall()]
+        print('-- {0}'.format(name))
+        print('\n'.join(plan))
+        print()
+
+
+def main():
+    connection = psycopg2.connect(DSN)
+    connection.autocommit = True
+    cursor = connection.cursor()
+    print('{0} slot times, {1} booking types'.format(ROWS, BOOKING_TYPES))
+    cursor.execute(SETUP.format(schema=SCHEMA, rows=ROWS,
+                                booking_types=BOOKING_TYPES))
+    print('=== foreign key indexes only\n')
+    explain(cursor)
+    cursor.execute(INDEXES.format(schema=SCHEMA))
+    print('=== with the indexes of migration 0005\n')
+    explain(cursor)
+    cursor.execute('DROP SCHEMA {0} CASCADE'.format(SCHEMA))
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
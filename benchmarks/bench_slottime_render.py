@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the rendering of the booking buttons of slottime_select.html:
+the template loop with a {% url %} and two {% blocktrans %} with three date
+filters for every slot time, formerly used by the template, against the
+slottime_buttons template tag.
+
+SLOTS slot times of 30 minutes (8 every working day from today) are
+rendered, half of them stored and half of them virtual. Only the template
+layer and the URL resolver are configured: no database is used.
+
+Run it from the root of the repository with::
+
+    python benchmarks/bench_slottime_render.py [SLOTS]
+"""
+from __future__ import print_function, unicode_literals
+
+import collections
+import datetime
+import os
+import sys
+import timeit
+import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from django.conf import settings  # noqa
+
+settings.configure(
+    USE_TZ=True,
+    TIME_ZONE='Europe/Rome',
+    USE_I18N=True,
+    LANGUAGE_CODE='it',
+    INSTALLED_APPS=['nowait'],
+    ROOT_URLCONF='bench_slottime_render_urls',
+)
+
+from django.conf.urls import include, patterns, url  # noqa
+from django.template import Context, Template  # noqa
+from django.utils import timezone, translation  # noqa
+
+SLOTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+REPEAT = 5
+
+# the names of the URLs of nowait.urls reversed by the templates, bound to
+# a view never called: nowait.urls needs the settings of mezzanine
+urls = types.ModuleType(str('bench_slottime_render_urls'))
+urls.urlpatterns = patterns(
+    '',
+    url(r'^nowait/', include(patterns(
+        '',
+        url(r'^booking/create/(?P<slottime_pk>\d+)/$', lambda request: None,
+            name='booking_create'),
+        url(r'^booking/create/(?P<slug>[-_\w]+)/(?P<timestamp>\d+)/$',
+            lambda request: None, name='booking_create_virtual'),
+    ), namespace='nowait')))
+sys.modules[urls.__name__] = urls
+
+BookingType = collections.namedtuple('BookingType', ['slug'])
+SlotTime = collections.namedtuple('SlotTime',
+                                  ['pk', 'booking_type', 'start', 'end'])
+
+LOOP_TEMPLATE = Template('''{% load i18n %}
+{% for slottime in slottimes %}
+    <div class="col-sm-6 col-md-4">
+        <a href="{% if slottime.pk %}{% url 'nowait:booking_create' slottime_pk=slottime.pk %}{% else %}{% url 'nowait:booking_create_virtual' slug=slottime.booking_type.slug timestamp=slottime.start|date:"U" %}{% endif %}"
+           id="btn_book_slottime_{% if slottime.pk %}{{ slottime.pk }}{% else %}v{{ slottime.start|date:"U" }}{% endif %}"
+           class="btn btn-primary thumbnail"
+           title="{% trans "Select slot time" %}&nbsp;{% blocktrans with day=slottime.start|date:"l j" from=slottime.start|date:"H:i" to=slottime.end|date:"H:i" %}{{ day }} from {{ from }} to {{ to }}{% endblocktrans %}">
+            {% blocktrans with day=slottime.start|date:"l j" from=slottime.start|date:"H:i" to=slottime.end|date:"H:i" %}
+                {{ day }}&nbsp;from&nbsp;{{ from }}&nbsp;to&nbsp;{{ to }}
+            {% endblocktrans %}
+        </a>
+    </div>
+{% endfor %}''')  # noqa
+
+TAG_TEMPLATE = Template(
+    '{% load nowait_tags %}{% slottime_buttons slottimes %}')
+
+
+def get_slottimes():
+    booking_type = BookingType('ufficio-anagrafe')
+    tz = timezone.get_current_timezone()
+    day = datetime.date.today()
+    slottimes = []
+    while len(slottimes) < SLOTS:
+        day += datetime.timedelta(days=1)
+        if day.weekday() > 4:
+            continue
+        for i in range(0, 8):
+            start = tz.localize(datetime.datetime.combine(
+                day, datetime.time(9))) + datetime.timedelta(minutes=30 * i)
+            pk = len(slottimes) + 1 if len(slottimes) % 2 else None
+            slottimes.append(SlotTime(pk, booking_type, start,
+                                      start + datetime.timedelta(minutes=30)))
+    return slottimes[:SLOTS]
+
+
+def main():
+    translation.activate(settings.LANGUAGE_CODE)
+    context = Context({'slottimes': get_slottimes()})
+    outputs = {}
+    print('{0} slot times'.format(SLOTS))
+    for name, template in [('template loop', LOOP_TEMPLATE),
+                           ('slottime_buttons', TAG_TEMPLATE)]:
+        outputs[name] = template.render(context)
+        best = min(timeit.repeat(lambda: template.render(context), number=1,
+                                 repeat=REPEAT))
+        print('{0:<20} {1:8.2f} ms {2:8d} bytes'.format(
+            name, best * 1000, len(outputs[name].encode('utf-8'))))
+    assert all(output.count('<a ') == SLOTS for output in outputs.values())
+
+
+if __name__ == '__main__':
+    main()
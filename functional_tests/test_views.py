@@ -10,6 +10,8 @@ except ImportError:
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import striptags
 
+from selenium.webdriver.support.ui import WebDriverWait
+
 from nowait.tests.factories import AdminF, BookingType30F
 from .base import FunctionalTest
 
@@ -78,11 +80,15 @@ class SlottimeSelectViewTest(FunctionalTest):
         self.browser.get(self.get_url(
             reverse('nowait:slottime_select',
                     kwargs={'slug': self.bookingtype.slug})))
-        for start_date in self.start_dates:
+        for counter, start_date in enumerate(self.start_dates, 1):
             slottimes = self.bookingtype.slottime_set.filter(
                 start__range=(start_date, start_date + timedelta(days=8)))
-            tab_pane = self.browser.find_element_by_css_selector(
-                '.tab-content #{month}'.format(
-                    month=('{0:%B}'.format(start_date)).lower()))
-            thumbs = tab_pane.find_elements_by_css_selector('a.thumbnail')
+            self.browser.find_element_by_css_selector(
+                '.nowait-slottime-months a[href="#nowait-month-{0}"]'.format(
+                    counter)).click()
+            # the months after the first one are loaded opening their tab
+            thumbs = WebDriverWait(self.browser, 10).until(
+                lambda browser: browser.find_elements_by_css_selector(
+                    '.tab-content #nowait-month-{0} a.thumbnail'.format(
+                        counter)))
             self.assertEqual(len(thumbs), len(slottimes))
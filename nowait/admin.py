@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
 from copy import deepcopy
 
+from django.conf.urls import patterns, url
 from django.contrib import admin
 from django.contrib.admin.templatetags.admin_urls import admin_urlname
 from django.contrib import messages
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.utils.html import escape
 from django.utils.translation import ugettext, ugettext_lazy as _
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
 
 # don't delete next two lines before DisplayableAdmin because
 # raise more error in testing
@@ -18,8 +23,9 @@ User = get_user_model()
 from mezzanine.core.admin import DisplayableAdmin, TabularDynamicInlineAdmin
 
 from .defaults import NOWAIT_GROUP_ADMINS
-from .models import (Booking, BookingType, Calendar, DailySlotTimePattern,
-                     Email, SlotTime, SlotTimesGeneration)
+from .models import (Booking, BookingType, Calendar, Closure,
+                     DailySlotTimePattern, Email, SlotTime,
+                     SlotTimesGeneration)
 from .forms import BookingTypeAdminForm
 
 
@@ -63,7 +69,8 @@ class BookingTypeAdmin(MixinCheckOperatorAdminView, DisplayableAdmin):
         _('Booking type data'),
         {'fields': ('title', 'slot_length', 'calendar', 'intro',
                     'informations', 'operators', 'notifications_email_enable',
-                    'notifications_emails', 'raw_location')})
+                    'notifications_emails', 'raw_location',
+                    'virtual_slottimes')})
     form = BookingTypeAdminForm
     inlines = [DailySlotTimePatternInline]
     list_display = ('title', 'status', 'admin_link', 'calendar', 'slot_length',
@@ -124,11 +131,26 @@ class CalendarAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
 
 
 class SlotTimesGenerationAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
-    actions = ['create_slottimes']
+    actions = ['preview_slottimes', 'create_slottimes',
+               'regenerate_slottimes']
     list_display = ['pk', 'booking_type', 'start_date',
-                    'end_date', 'user', 'created', 'slottimes_lt']
+                    'end_date', 'user', 'created', 'slottimes_lt',
+                    'progress', 'summary']
     list_per_page = 20
 
+    class Media:
+        js = ('js/mezzanine_nowait_admin.js',)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.module_name
+        urlpatterns = patterns(
+            '',
+            url(r'^(?P<pk>\d+)/progress/$',
+                self.admin_site.admin_view(self.progress_view),
+                name='%s_%s_progress' % info),
+        )
+        return urlpatterns + super(SlotTimesGenerationAdmin, self).get_urls()
+
     def save_model(self, request, obj, form, change):
         obj.user = request.user
         obj.save()
@@ -143,12 +165,61 @@ class SlotTimesGenerationAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
     slottimes_lt.short_description = _('slottimes generated')
     slottimes_lt.allow_tags = True
 
+    def progress(self, obj):
+        return ('<span class="nowait-generation-progress" data-url="{url}"'
+                ' data-status="{obj.status}" title="{errors}">'
+                '{obj.slottimes_done}/{obj.slottimes_total}'
+                ' ({status})</span>'.format(
+                    url=reverse(admin_urlname(obj._meta, 'progress'),
+                                args=(obj.pk,)),
+                    obj=obj, status=obj.get_status_display(),
+                    errors=escape(obj.errors)))
+    progress.short_description = _('progress')
+    progress.allow_tags = True
+
+    def progress_view(self, request, pk):
+        obj = get_object_or_404(self.model, pk=pk)
+        data = {'status': obj.status,
+                'status_display': '%s' % obj.get_status_display(),
+                'done': obj.slottimes_done,
+                'total': obj.slottimes_total,
+                'errors': obj.errors}
+        return HttpResponse(json.dumps(data),
+                            content_type='application/json')
+
+    def preview_slottimes(self, request, queryset):
+        previews = []
+        for obj in queryset.select_related('booking_type'):
+            try:
+                previews.append((obj, obj.preview_slot_times(), None))
+            except ValueError as e:
+                previews.append((obj, None, '%s' % e))
+        context = {'title': ugettext('Preview of slot times generations'),
+                   'opts': self.model._meta,
+                   'app_label': self.model._meta.app_label,
+                   'previews': previews}
+        return TemplateResponse(
+            request, 'admin/nowait/slottimesgeneration/preview.html',
+            context, current_app=self.admin_site.name)
+    preview_slottimes.short_description = (
+        _("Preview slottimes of generation"))
+
     def create_slottimes(self, request, queryset):
-        for obj in queryset:
-            obj.create_slot_times()
+        SlotTimesGeneration.objects.queue(queryset)
+        msg = _('%(count)s slot times generations queued') % {
+            'count': len(queryset)}
+        self.message_user(request, msg, level=messages.SUCCESS)
     create_slottimes.short_description = (
         _("Create slottimes from generation"))
 
+    def regenerate_slottimes(self, request, queryset):
+        SlotTimesGeneration.objects.queue(queryset, regenerate=True)
+        msg = _('%(count)s slot times regenerations queued') % {
+            'count': len(queryset)}
+        self.message_user(request, msg, level=messages.SUCCESS)
+    regenerate_slottimes.short_description = (
+        _("Align free slottimes to current patterns"))
+
 
 class SlotTimeAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
     date_hierarchy = 'start'
@@ -167,6 +238,28 @@ class SlotTimeAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
     calendar_link.short_description = _('calendar')
 
 
+class ClosureAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
+    date_hierarchy = 'start_date'
+    list_display = ['pk', 'calendar', 'booking_type', 'start_date',
+                    'end_date', 'start_time', 'end_time', 'reason']
+    list_filter = ['calendar', 'booking_type']
+    list_per_page = 20
+
+    def save_model(self, request, obj, form, change):
+        obj.save()
+        deleted, taken = obj.prune_slottimes()
+        msg = _('%(count)s free slot times deleted') % {'count': deleted}
+        self.message_user(request, msg, level=messages.SUCCESS)
+        if taken:
+            msg = _('%(count)s slot times already booked are hit by the'
+                    ' closure: %(slottimes)s') % {
+                'count': len(taken),
+                'slottimes': ', '.join(
+                    '%s (%s)' % (slottime, slottime.booking_type.title)
+                    for slottime in taken)}
+            self.message_user(request, msg, level=messages.WARNING)
+
+
 class BookingAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
     list_display = ['pk', 'booker', 'formatted_day', 'formatted_start',
                     'formatted_end', 'notes', 'telephone']
@@ -196,6 +289,7 @@ class BookingAdmin(MixinCheckOperatorAdminView, admin.ModelAdmin):
 admin.site.register(Booking, BookingAdmin)
 admin.site.register(BookingType, BookingTypeAdmin)
 admin.site.register(Calendar, CalendarAdmin)
+admin.site.register(Closure, ClosureAdmin)
 admin.site.register(Email, EmailAdmin)
 admin.site.register(SlotTime, SlotTimeAdmin)
 admin.site.register(SlotTimesGeneration, SlotTimesGenerationAdmin)
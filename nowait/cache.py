@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Per booking type cache of the free slot times shown by SlottimeSelectView,
+stored with the Django cache framework.
+
+Every booking type has a version number stored in the cache and the keys of
+its entries contain it: invalidating a booking type increments the version,
+so all the app nodes sharing the cache backend stop reading the old entries
+at the same time and these expire by themselves.
+
+The cache holds also the availability bitmaps of every month of a booking
+type: for every day an integer with a bit set for every free slot time,
+at its position on the grid of the day (see core.get_slot_position). They
+have their own version, incremented only by the changes that can't be
+applied bit by bit.
+
+Inside a replica_reads block the values missing from the cache are
+computed on the read replica, except for the booking types written in the
+last NOWAIT_READ_REPLICA_PIN_SECONDS seconds: a lagging replica would store
+under the new version the values before the write, so they're computed on
+the default database.
+
+A version incremented inside a transaction is incremented again after the
+commit: a concurrent request can read the rows before the commit and store
+them under the first new version. The bits of the slot times written inside
+a transaction are changed only after the commit, or if the transaction is
+rolled back the bitmaps of their booking types are invalidated.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    from django.db.transaction import commit_on_success as atomic
+from django.utils.timezone import localtime
+
+from mezzanine.conf import settings
+
+from .core import get_slot_position
+from .routers import get_replica, primary_reads
+
+VERSION_KEY = 'nowait:availability:{booking_type_id}:version'
+AVAILABILITY_KEY = 'nowait:availability:{booking_type_id}:{version}:{key}'
+COMBINED_KEY = 'nowait:availability:combined:{versions}:{key}'
+WRITTEN_KEY = 'nowait:availability:{booking_type_id}:written'
+BITMAP_VERSION_KEY = 'nowait:bitmap:{booking_type_id}:version'
+BITMAP_KEY = 'nowait:bitmap:{booking_type_id}:{version}:{month:%Y-%m}'
+BITMAP_LOCK_KEY = 'nowait:bitmap:{booking_type_id}:{month:%Y-%m}:lock'
+BITMAP_LOCK_TIMEOUT = 10
+
+_batch = threading.local()
+_commit = threading.local()
+
+
+def get_version(booking_type_id, version_key=VERSION_KEY):
+    """
+    Return the current version of the cache entries of booking_type_id, or
+    of its bitmaps with version_key BITMAP_VERSION_KEY.
+    """
+    version_key = version_key.format(booking_type_id=booking_type_id)
+    version = cache.get(version_key)
+    if version is None:
+        # a version evicted by the cache restarts from the clock, so it
+        # never reuses the number of entries written before
+        cache.add(version_key, int(time.time() * 1000))
+        version = cache.get(version_key)
+    return version
+
+
+def _compute(booking_type_ids, compute):
+    # a read replica behind the default database would store in the new
+    # version the values before the write that incremented it: the booking
+    # types written in the last seconds are computed on the default database
+    if get_replica() and cache.get_many([
+            WRITTEN_KEY.format(booking_type_id=booking_type_id)
+            for booking_type_id in booking_type_ids]):
+        with primary_reads():
+            return compute()
+    return compute()
+
+
+def get_availability(booking_type_id, key, compute):
+    """
+    Return the value cached for booking_type_id under key or compute it
+    calling compute and store it.
+
+    The version is read before compute is called: if booking_type_id is
+    invalidated meanwhile the value is stored under the old version and
+    never read.
+    """
+    cache_key = AVAILABILITY_KEY.format(
+        booking_type_id=booking_type_id, version=get_version(booking_type_id),
+        key=key)
+    value = cache.get(cache_key)
+    if value is None:
+        value = _compute([booking_type_id], compute)
+        cache.set(cache_key, value,
+                  settings.NOWAIT_AVAILABILITY_CACHE_TIMEOUT)
+    return value
+
+
+def get_combined_availability(booking_type_ids, key, compute, timeout):
+    """
+    Like get_availability for a value depending on the availability of all
+    the booking types of booking_type_ids: its cache key contains all their
+    versions, read with one get_many, so invalidating any of them
+    invalidates it.
+    """
+    booking_type_ids = sorted(set(booking_type_ids))
+    version_keys = dict(
+        (booking_type_id, VERSION_KEY.format(booking_type_id=booking_type_id))
+        for booking_type_id in booking_type_ids)
+    versions = cache.get_many(list(version_keys.values()))
+    signature = ','.join(
+        '{0}:{1}'.format(booking_type_id,
+                         versions.get(version_keys[booking_type_id]) or
+                         get_version(booking_type_id))
+        for booking_type_id in booking_type_ids)
+    cache_key = COMBINED_KEY.format(
+        versions=hashlib.md5(signature.encode('utf-8')).hexdigest(), key=key)
+    value = cache.get(cache_key)
+    if value is None:
+        value = _compute(booking_type_ids, compute)
+        cache.set(cache_key, value, timeout)
+    return value
+
+
+def _in_transaction():
+    # Django 1.5 has no atomic blocks: the changes are applied at once
+    return getattr(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False)
+
+
+def _get_pending():
+    if getattr(_commit, 'versions', None) is None:
+        _commit.versions, _commit.bitmaps = set(), []
+    return _commit
+
+
+def _incr(version_key, booking_type_id):
+    try:
+        cache.incr(version_key.format(booking_type_id=booking_type_id))
+    except ValueError:
+        # no version stored: the next get_version starts a new one
+        pass
+    if get_replica():
+        cache.set(WRITTEN_KEY.format(booking_type_id=booking_type_id), 1,
+                  settings.NOWAIT_READ_REPLICA_PIN_SECONDS)
+
+
+def _increment_version(version_key, booking_type_id):
+    _incr(version_key, booking_type_id)
+    if _in_transaction():
+        _get_pending().versions.add((version_key, booking_type_id))
+
+
+def run_commit_invalidations(committed=True):
+    """
+    Increment again the versions incremented inside the transaction just
+    ended and apply its changes of the bitmaps, or invalidate them if the
+    transaction isn't committed. It's called at the end of the outermost
+    atomic_invalidation block and of every request, after the commit of
+    ATOMIC_REQUESTS.
+    """
+    versions, _commit.versions = getattr(_commit, 'versions', None), None
+    bitmaps, _commit.bitmaps = getattr(_commit, 'bitmaps', None), None
+    versions = set(versions or ())
+    for booking_type_id, start, free in bitmaps or ():
+        if committed:
+            _apply_bitmap(booking_type_id, start, free)
+        else:
+            versions.add((BITMAP_VERSION_KEY, booking_type_id))
+    for version_key, booking_type_id in versions:
+        _incr(version_key, booking_type_id)
+
+
+@contextmanager
+def atomic_invalidation():
+    """
+    Context manager like atomic that, if it's the outermost block, runs
+    run_commit_invalidations at its end. The bitmaps changed by a block
+    rolled back are invalidated instead.
+    """
+    mark = len(_get_pending().bitmaps)
+    try:
+        with atomic():
+            yield
+    except Exception:
+        pending = _get_pending()
+        for booking_type_id, start, free in pending.bitmaps[mark:]:
+            pending.versions.add((BITMAP_VERSION_KEY, booking_type_id))
+        del pending.bitmaps[mark:]
+        raise
+    finally:
+        if not _in_transaction():
+            run_commit_invalidations()
+
+
+def invalidate_availability(booking_type_id):
+    """
+    Invalidate the cache entries of booking_type_id, or only record it if
+    called inside a batch_invalidation block.
+    """
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None:
+        pending.add(booking_type_id)
+        return
+    _increment_version(VERSION_KEY, booking_type_id)
+
+
+def _get_bitmap_key(booking_type_id, month):
+    return BITMAP_KEY.format(
+        booking_type_id=booking_type_id,
+        version=get_version(booking_type_id, BITMAP_VERSION_KEY), month=month)
+
+
+def get_bitmap(booking_type_id, month, compute):
+    """
+    Return the availability bitmaps of booking_type_id in the month of the
+    date month, or compute them calling compute and store them.
+
+    :return: (step, {day of the month: bitmap}) with the step in minutes of
+             the grid of the bitmaps
+    """
+    cache_key = _get_bitmap_key(booking_type_id, month.replace(day=1))
+    value = cache.get(cache_key)
+    if value is None:
+        value = _compute([booking_type_id], compute)
+        cache.set(cache_key, value,
+                  settings.NOWAIT_AVAILABILITY_CACHE_TIMEOUT)
+    return value
+
+
+def update_bitmap(booking_type_id, start, free):
+    """
+    Set, if free, or clear the bit of the slot time of booking_type_id
+    starting at the aware datetime start in the bitmaps of its month, if
+    they're cached. Inside a batch_invalidation block the bitmaps of
+    booking_type_id are invalidated at the end of the block instead, inside
+    a transaction the bit is changed after the commit.
+    """
+    pending = getattr(_batch, 'bitmaps', None)
+    if pending is not None:
+        pending.add(booking_type_id)
+        return
+    if _in_transaction():
+        _get_pending().bitmaps.append((booking_type_id, start, free))
+        return
+    _apply_bitmap(booking_type_id, start, free)
+
+
+def _apply_bitmap(booking_type_id, start, free):
+    # the read and the write of the entry are made holding a lock, so
+    # concurrent updates of the same month aren't lost: if the lock is
+    # already held the bitmaps are invalidated instead
+    local_start = localtime(start)
+    month = local_start.date().replace(day=1)
+    lock_key = BITMAP_LOCK_KEY.format(booking_type_id=booking_type_id,
+                                      month=month)
+    if not cache.add(lock_key, 1, BITMAP_LOCK_TIMEOUT):
+        _incr(BITMAP_VERSION_KEY, booking_type_id)
+        return
+    try:
+        cache_key = _get_bitmap_key(booking_type_id, month)
+        value = cache.get(cache_key)
+        if value is None:
+            return
+        step, bitmaps = value
+        bit = 1 << get_slot_position(step, local_start)
+        bitmap = bitmaps.get(local_start.day, 0)
+        bitmaps[local_start.day] = bitmap | bit if free else bitmap & ~bit
+        cache.set(cache_key, value,
+                  settings.NOWAIT_AVAILABILITY_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def invalidate_bitmaps(booking_type_id):
+    """
+    Invalidate the availability bitmaps of booking_type_id, or only record
+    it if called inside a batch_invalidation block.
+    """
+    pending = getattr(_batch, 'bitmaps', None)
+    if pending is not None:
+        pending.add(booking_type_id)
+        return
+    _increment_version(BITMAP_VERSION_KEY, booking_type_id)
+
+
+@contextmanager
+def batch_invalidation():
+    """
+    Context manager that collects the invalidations of the block, for
+    example the ones sent by the post_delete signal of every deleted slot
+    time, and runs them once for every booking type at the end.
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending, _batch.bitmaps = set(), set()
+    try:
+        yield
+    finally:
+        pending, _batch.pending = _batch.pending, None
+        bitmaps, _batch.bitmaps = _batch.bitmaps, None
+        for booking_type_id in pending:
+            invalidate_availability(booking_type_id)
+        for booking_type_id in bitmaps:
+            invalidate_bitmaps(booking_type_id)
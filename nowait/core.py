@@ -3,11 +3,38 @@
 import calendar
 import collections
 import datetime
-import inspect
+from array import array
+from bisect import bisect_left
 
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
 
-def get_range_days(start_date, end_date):
+try:
+    from pytz import AmbiguousTimeError, NonExistentTimeError
+except ImportError:
+    # without pytz the timezones have no DST transitions to resolve
+    class AmbiguousTimeError(Exception):
+        pass
+
+    class NonExistentTimeError(Exception):
+        pass
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 24 * 60 * 60
+
+try:
+    array('q')
+    TIMESTAMP_TYPECODE = 'q'
+except ValueError:
+    # python 2 has no 'long long' typecode
+    TIMESTAMP_TYPECODE = 'l'
 
+SlotTimeArrays = collections.namedtuple('SlotTimeArrays', ['starts', 'ends'])
+
+
+def _check_range_days(start_date, end_date):
     if (not isinstance(start_date, datetime.date) or
             not isinstance(end_date, datetime.date)):
         raise TypeError('both start_date and end_date must be of type'
@@ -15,41 +42,281 @@ def get_range_days(start_date, end_date):
     if start_date > end_date:
         raise ValueError('start_date must be greater than end_date')
 
-    if start_date.year != end_date.year:
-        raise ValueError('start_date and end_date must be dates of'
-                         ' same year')
-
-    c = calendar.Calendar()
-    if start_date.month == end_date.month:
-        return [date_obj for date_obj in c.itermonthdates(start_date.year,
-                                                          start_date.month)
-                if ((date_obj.month == start_date.month)
-                    and (start_date.day <= date_obj.day <= end_date.day))]
-
-    days = []
-    for month in range(start_date.month, end_date.month + 1):
-        month_days = [date_obj for date_obj in c.itermonthdates(
-            start_date.year, month) if (date_obj.month == month)]
-        if month == start_date.month:
-            days += [date_obj for date_obj in month_days
-                     if date_obj.day >= start_date.day]
-        elif month == end_date.month:
-            days += [date_obj for date_obj in month_days
-                     if date_obj.day <= end_date.day]
-        else:
-            days += month_days
-        del month_days
-    return days
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _iter_days(start_date, end_date, step):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += step
+
+
+def iter_range_days(start_date, end_date):
+    """
+    Return a generator of the dates from start_date to end_date (both
+    included). The range can cross any number of years and the dates are
+    yielded one at a time, so memory usage is constant.
+    """
+    _check_range_days(start_date, end_date)
+    return _iter_days(_as_date(start_date), _as_date(end_date),
+                      datetime.timedelta(days=1))
+
+
+def get_range_days(start_date, end_date):
+    return list(iter_range_days(start_date, end_date))
 
 
 def get_week_map_by_weekday(date_list):
-    args, _, _, values = inspect.getargvalues(inspect.currentframe())
-    for arg in args:
-        if not isinstance(values[arg], collections.Iterable):
-            raise ValueError('parameter {} is not iterable'.format(arg))
+    if not isinstance(date_list, collections.Iterable):
+        raise ValueError('parameter date_list is not iterable')
     result = dict((str(weekday), list()) for weekday in range(0, 7))
 
     for date in date_list:
         result[str(date.weekday())].append(date)
 
     return result
+
+
+def datetime_to_timestamp(value):
+    """
+    Return the POSIX timestamp (in seconds) of the aware datetime value.
+    """
+    return calendar.timegm(value.utctimetuple())
+
+
+def timestamp_to_datetime(timestamp, tz):
+    """
+    Return the aware datetime in timezone tz of the POSIX timestamp.
+    """
+    return datetime.datetime.fromtimestamp(timestamp, tz)
+
+
+def get_utc_offset(tz, naive_datetime, is_dst=False):
+    """
+    Return the offset in seconds from UTC of naive_datetime localized in
+    timezone tz.
+
+    With pytz timezones is_dst is passed to localize: None raises an error
+    for the times that don't exist or are ambiguous because of a DST
+    transition.
+    """
+    if hasattr(tz, 'localize'):
+        aware_datetime = tz.localize(naive_datetime, is_dst=is_dst)
+    else:
+        aware_datetime = naive_datetime.replace(tzinfo=tz)
+    offset = aware_datetime.utcoffset()
+    return offset.days * SECONDS_PER_DAY + offset.seconds
+
+
+def get_utc_offset_table(tz, start_date, end_date):
+    """
+    Return a dict with the UTC offset in seconds of every day from
+    start_date to end_date (both included) in timezone tz.
+
+    The offset of a day is resolved once, comparing its midnight with the
+    next one: the days with a DST transition have no single offset and are
+    mapped to None.
+    """
+    table = {}
+    midnight = datetime.datetime.combine(_as_date(start_date),
+                                         datetime.time())
+    offset = get_utc_offset(tz, midnight)
+    for day in iter_range_days(start_date, end_date):
+        midnight += datetime.timedelta(days=1)
+        next_offset = get_utc_offset(tz, midnight)
+        table[day] = offset if offset == next_offset else None
+        offset = next_offset
+    return table
+
+
+def _transition_day_timestamps(tz, day, offsets):
+    """
+    Yield the POSIX timestamps of the local times day + offsets on a day
+    with a DST transition: the times skipped by the spring-forward gap are
+    dropped and the ones repeated by the autumn overlap take their first
+    occurrence.
+    """
+    midnight = (day.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+    for offset in offsets:
+        local = datetime.datetime.combine(
+            day, datetime.time()) + datetime.timedelta(seconds=offset)
+        try:
+            utc_offset = get_utc_offset(tz, local, is_dst=None)
+        except NonExistentTimeError:
+            continue
+        except AmbiguousTimeError:
+            utc_offset = get_utc_offset(tz, local, is_dst=True)
+        yield midnight + offset - utc_offset
+
+
+def get_local_timestamps(tz, day, offsets):
+    """
+    Return the list of the POSIX timestamps of the local times day + offsets
+    (seconds from midnight) in timezone tz, resolved like expand_slot_times
+    does: the times skipped by a spring-forward gap are dropped and the ones
+    repeated by an autumn overlap take their first occurrence.
+    """
+    utc_offset = get_utc_offset_table(tz, day, day)[day]
+    if utc_offset is None:
+        return list(_transition_day_timestamps(tz, day, offsets))
+    midnight = (day.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+    return [midnight + offset - utc_offset for offset in offsets]
+
+
+def _time_to_seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def expand_slot_times(patterns, slot_length, start_date, end_date, tz):
+    """
+    Expand in one pass a set of daily patterns over the days from start_date
+    to end_date (both included).
+
+    The slot offsets of every weekday are computed once and the UTC offsets
+    of the days are read from get_utc_offset_table, so every day costs only
+    one array extension. Only on the days with a DST transition the slot
+    times are localized one by one: the ones in the spring-forward gap are
+    skipped and the ones in the autumn overlap take the first occurrence.
+
+    :param patterns: iterable of (weekday, start_time, end_time) tuples
+    :param slot_length: length in minutes of the slot times
+    :param tz: timezone of start_time and end_time of patterns
+    :return: SlotTimeArrays with the POSIX timestamps of start and end of
+             every slot time
+    :rtype: SlotTimeArrays
+    """
+    length = slot_length * 60
+    offsets_by_weekday = dict((weekday, []) for weekday in range(0, 7))
+    for weekday, start_time, end_time in patterns:
+        offsets_by_weekday[int(weekday)].extend(range(
+            _time_to_seconds(start_time),
+            _time_to_seconds(end_time) - length + 1, length))
+    for offsets in offsets_by_weekday.values():
+        offsets.sort()
+
+    starts = array(TIMESTAMP_TYPECODE)
+    utc_offsets = get_utc_offset_table(tz, start_date, end_date)
+    for day in iter_range_days(start_date, end_date):
+        offsets = offsets_by_weekday[day.weekday()]
+        if not offsets:
+            continue
+        utc_offset = utc_offsets[day]
+        if utc_offset is None:
+            starts.extend(_transition_day_timestamps(tz, day, offsets))
+            continue
+        midnight = ((day.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY -
+                    utc_offset)
+        starts.extend(midnight + offset for offset in offsets)
+    ends = array(TIMESTAMP_TYPECODE, (start + length for start in starts))
+    return SlotTimeArrays(starts, ends)
+
+
+def exclude_overlapping(slot_times, index):
+    """
+    Return the SlotTimeArrays of slot_times without the slot times that
+    overlap an interval of the IntervalIndex index.
+    """
+    if not len(index):
+        return slot_times
+    starts, ends = array(TIMESTAMP_TYPECODE), array(TIMESTAMP_TYPECODE)
+    for start, end in zip(*slot_times):
+        if not index.overlaps(start, end):
+            starts.append(start)
+            ends.append(end)
+    return SlotTimeArrays(starts, ends)
+
+
+def merge_intervals(intervals):
+    """
+    Return the sorted list of the half-open intervals [start, end) obtained
+    merging the overlapping or adjacent ones of intervals.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class IntervalIndex(object):
+    """
+    Sorted index of half-open intervals [start, end) that don't overlap each
+    other, for example the slot times of a booking type.
+
+    Both the overlap check and the lookup of the insertion point are binary
+    searches, so checking a candidate costs O(log n).
+    """
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, end in intervals]
+        self.ends = [end for start, end in intervals]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        """
+        Return True if interval [start, end) overlaps with an interval of the
+        index.
+        """
+        # the only candidate is the last interval starting before end, the
+        # previous ones end before its start
+        index = bisect_left(self.starts, end)
+        return bool(index) and self.ends[index - 1] > start
+
+    def add(self, start, end):
+        """
+        Add interval [start, end) to the index if it doesn't overlap with the
+        others.
+
+        :return: True if the interval is added, False otherwise
+        """
+        if self.overlaps(start, end):
+            return False
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        return True
+
+
+def get_grid_step(slot_length, start_times):
+    """
+    Return the step in minutes of the grid of the slot times of a day: the
+    greatest common divisor of slot_length and of the minutes from midnight
+    of the times in start_times (the starts of the daily patterns), so every
+    slot time generated from the patterns starts on a multiple of it.
+    """
+    step = slot_length
+    for start_time in start_times:
+        step = gcd(step, start_time.hour * 60 + start_time.minute)
+    return step or 1
+
+
+def get_slot_position(step, value):
+    """
+    Return the position in the bitmap of a day of the slot time starting at
+    the time (or naive local datetime) value on a grid of step minutes.
+
+    Slot times that don't overlap start at least one slot length, so one
+    step, apart: they never share a position.
+    """
+    return (value.hour * 60 + value.minute) // step
+
+
+def iter_bitmap_positions(bitmap):
+    """
+    Iterate over the positions of the set bits of the integer bitmap, from
+    the lowest.
+    """
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
@@ -9,6 +9,11 @@ NOWAIT_GROUP_ADMINS = ('nowait_admins', '*')
 NOWAIT_GROUP_OPERATORS = ('nowait_operators', '*')
 NOWAIT_ROOT_SLUG = 'nowait'
 NOWAIT_CALENDAR_TASK_ENABLE = False
+NOWAIT_AVAILABILITY_CACHE_TIMEOUT = 60 * 60
+NOWAIT_NEXT_AVAILABLE_CACHE_TIMEOUT = 60
+NOWAIT_READ_REPLICA = ''
+NOWAIT_SLOTTIME_SELECT_STREAMING = False
+NOWAIT_READ_REPLICA_PIN_SECONDS = 30
 
 
 register_setting(
@@ -38,3 +43,43 @@ register_setting(
     editable=True,
     default=NOWAIT_CALENDAR_TASK_ENABLE
 )
+
+register_setting(
+    name='NOWAIT_AVAILABILITY_CACHE_TIMEOUT',
+    description='Seconds the free slot times of a booking type are cached',
+    editable=False,
+    default=NOWAIT_AVAILABILITY_CACHE_TIMEOUT
+)
+
+register_setting(
+    name='NOWAIT_NEXT_AVAILABLE_CACHE_TIMEOUT',
+    description='Seconds the first free slot times of a set of booking types'
+                ' are cached',
+    editable=False,
+    default=NOWAIT_NEXT_AVAILABLE_CACHE_TIMEOUT
+)
+
+register_setting(
+    name='NOWAIT_READ_REPLICA',
+    description='Alias of the database the public views read from, used by'
+                ' nowait.routers.ReplicaRouter (empty to read from default)',
+    editable=False,
+    default=NOWAIT_READ_REPLICA
+)
+
+register_setting(
+    name='NOWAIT_READ_REPLICA_PIN_SECONDS',
+    description='Seconds the reads of a user are made on the default'
+                ' database after a booking',
+    editable=False,
+    default=NOWAIT_READ_REPLICA_PIN_SECONDS
+)
+
+register_setting(
+    name='NOWAIT_SLOTTIME_SELECT_STREAMING',
+    description='Stream the page of selection of the slot times with all its'
+                ' months instead of loading the months after the first one'
+                ' on request',
+    editable=False,
+    default=NOWAIT_SLOTTIME_SELECT_STREAMING
+)
@@ -69,6 +69,9 @@ class BookingCreateForm(forms.ModelForm):
     def clean(self):
         cleaned_data = super(BookingCreateForm, self).clean()
         slottime_pk = cleaned_data.get('slottime')
+        if not slottime_pk or not slottime_pk.isdigit():
+            # virtual slot times have no pk until the booking is saved
+            return cleaned_data
         try:
             Booking.objects.get(slottime_id=slottime_pk)
             raise forms.ValidationError(_('Slot time selected is already'
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import BookingType, DailyAvailability
+
+
+class Command(BaseCommand):
+    help = ('Rebuild from scratch the daily counters of free and taken slot'
+            ' times of all booking types (or of one with --booking-type).')
+    option_list = BaseCommand.option_list + (
+        make_option('--booking-type', dest='booking_type', default=None,
+                    help='Slug of the booking type to rebuild'),
+    )
+
+    def handle(self, *args, **options):
+        booking_type = None
+        if options['booking_type']:
+            try:
+                booking_type = BookingType.objects.get(
+                    slug=options['booking_type'])
+            except BookingType.DoesNotExist:
+                raise CommandError('Booking type "%s" does not exist' %
+                                   options['booking_type'])
+        count = DailyAvailability.objects.rebuild(booking_type=booking_type)
+        self.stdout.write('%s daily availabilities written' % count)
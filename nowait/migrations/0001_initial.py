@@ -7,14 +7,345 @@ from django.db import models
 
 class Migration(SchemaMigration):
 
+    depends_on = (
+        ('pages', '0008_auto__add_link'),
+    )
+
     def forwards(self, orm):
-        pass
+        # Adding model 'Calendar'
+        db.create_table(u'nowait_calendar', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('name', self.gf('django.db.models.fields.CharField')(unique=True, max_length=300)),
+            ('description', self.gf('django.db.models.fields.TextField')(default='', blank=True)),
+            ('owner', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['auth.User'], null=True, blank=True)),
+            ('gid', self.gf('django.db.models.fields.CharField')(unique=True, max_length=300, blank=True)),
+            ('gsummary', self.gf('django.db.models.fields.CharField')(max_length=300, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['Calendar'])
+
+        # Adding model 'Email'
+        db.create_table(u'nowait_email', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('email', self.gf('django.db.models.fields.EmailField')(unique=True, max_length=75)),
+            ('notes', self.gf('django.db.models.fields.CharField')(max_length=300, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['Email'])
+
+        # Adding model 'BookingType'
+        db.create_table(u'nowait_bookingtype', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('keywords_string', self.gf('django.db.models.fields.CharField')(max_length=500, blank=True)),
+            ('site', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['sites.Site'])),
+            ('title', self.gf('django.db.models.fields.CharField')(max_length=500)),
+            ('slug', self.gf('django.db.models.fields.CharField')(max_length=2000, null=True, blank=True)),
+            ('_meta_title', self.gf('django.db.models.fields.CharField')(max_length=500, null=True, blank=True)),
+            ('description', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('gen_description', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('created', self.gf('django.db.models.fields.DateTimeField')(null=True)),
+            ('updated', self.gf('django.db.models.fields.DateTimeField')(null=True)),
+            ('status', self.gf('django.db.models.fields.IntegerField')(default=2)),
+            ('publish_date', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('expiry_date', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('short_url', self.gf('django.db.models.fields.URLField')(max_length=200, null=True, blank=True)),
+            ('in_sitemap', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('slot_length', self.gf('django.db.models.fields.PositiveIntegerField')(default=30)),
+            ('intro', self.gf('mezzanine.core.fields.RichTextField')(blank=True)),
+            ('calendar', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['nowait.Calendar'], null=True, blank=True)),
+            ('informations', self.gf('mezzanine.core.fields.RichTextField')(blank=True)),
+            ('notification_emails_enable', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('raw_location', self.gf('django.db.models.fields.CharField')(max_length=500, blank=True)),
+            ('link', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['pages.Link'], null=True, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['BookingType'])
+
+        # Adding unique constraint on 'BookingType', fields ['calendar', 'title']
+        db.create_unique(u'nowait_bookingtype', ['calendar_id', 'title'])
+
+        # Adding M2M table for field operators on 'BookingType'
+        m2m_table_name = db.shorten_name(u'nowait_bookingtype_operators')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('bookingtype', models.ForeignKey(orm[u'nowait.bookingtype'], null=False)),
+            ('user', models.ForeignKey(orm[u'auth.user'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['bookingtype_id', 'user_id'])
+
+        # Adding M2M table for field notification_emails on 'BookingType'
+        m2m_table_name = db.shorten_name(u'nowait_bookingtype_notification_emails')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('bookingtype', models.ForeignKey(orm[u'nowait.bookingtype'], null=False)),
+            ('email', models.ForeignKey(orm[u'nowait.email'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['bookingtype_id', 'email_id'])
+
+        # Adding model 'DailySlotTimePattern'
+        db.create_table(u'nowait_dailyslottimepattern', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('booking_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['nowait.BookingType'])),
+            ('day', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('start_time', self.gf('django.db.models.fields.TimeField')()),
+            ('end_time', self.gf('django.db.models.fields.TimeField')()),
+        ))
+        db.send_create_signal(u'nowait', ['DailySlotTimePattern'])
+
+        # Adding unique constraint on 'DailySlotTimePattern', fields ['booking_type', 'day', 'start_time']
+        db.create_unique(u'nowait_dailyslottimepattern', ['booking_type_id', 'day', 'start_time'])
+
+        # Adding model 'SlotTimesGeneration'
+        db.create_table(u'nowait_slottimesgeneration', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('booking_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['nowait.BookingType'])),
+            ('start_date', self.gf('django.db.models.fields.DateField')()),
+            ('end_date', self.gf('django.db.models.fields.DateField')()),
+            ('user', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['auth.User'], null=True, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['SlotTimesGeneration'])
+
+        # Adding model 'SlotTime'
+        db.create_table(u'nowait_slottime', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('generation', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['nowait.SlotTimesGeneration'], null=True, blank=True)),
+            ('booking_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['nowait.BookingType'])),
+            ('start', self.gf('django.db.models.fields.DateTimeField')()),
+            ('end', self.gf('django.db.models.fields.DateTimeField')()),
+            ('status', self.gf('model_utils.fields.StatusField')(default='free', max_length=100, no_check_for_status=True)),
+            ('user', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['auth.User'], null=True, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['SlotTime'])
+
+        # Adding model 'Booking'
+        db.create_table(u'nowait_booking', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('booker', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['auth.User'])),
+            ('slottime', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['nowait.SlotTime'], unique=True)),
+            ('notes', self.gf('django.db.models.fields.TextField')(blank=True)),
+            ('telephone', self.gf('django.db.models.fields.CharField')(max_length=30, blank=True)),
+        ))
+        db.send_create_signal(u'nowait', ['Booking'])
 
     def backwards(self, orm):
-        pass
+        # Removing unique constraint on 'DailySlotTimePattern', fields ['booking_type', 'day', 'start_time']
+        db.delete_unique(u'nowait_dailyslottimepattern', ['booking_type_id', 'day', 'start_time'])
 
-    models = {
+        # Removing unique constraint on 'BookingType', fields ['calendar', 'title']
+        db.delete_unique(u'nowait_bookingtype', ['calendar_id', 'title'])
+
+        # Deleting model 'Booking'
+        db.delete_table(u'nowait_booking')
+
+        # Deleting model 'SlotTime'
+        db.delete_table(u'nowait_slottime')
+
+        # Deleting model 'SlotTimesGeneration'
+        db.delete_table(u'nowait_slottimesgeneration')
+
+        # Deleting model 'DailySlotTimePattern'
+        db.delete_table(u'nowait_dailyslottimepattern')
+
+        # Removing M2M table for field notification_emails on 'BookingType'
+        db.delete_table(db.shorten_name(u'nowait_bookingtype_notification_emails'))
 
+        # Removing M2M table for field operators on 'BookingType'
+        db.delete_table(db.shorten_name(u'nowait_bookingtype_operators'))
+
+        # Deleting model 'BookingType'
+        db.delete_table(u'nowait_bookingtype')
+
+        # Deleting model 'Email'
+        db.delete_table(u'nowait_email')
+
+        # Deleting model 'Calendar'
+        db.delete_table(u'nowait_calendar')
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'generic.assignedkeyword': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'AssignedKeyword'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'keyword': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'assignments'", 'to': u"orm['generic.Keyword']"}),
+            'object_pk': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'generic.keyword': {
+            'Meta': {'object_name': 'Keyword'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'})
+        },
+        u'nowait.booking': {
+            'Meta': {'object_name': 'Booking'},
+            'booker': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']"}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'notes': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'slottime': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['nowait.SlotTime']", 'unique': 'True'}),
+            'telephone': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'})
+        },
+        u'nowait.bookingtype': {
+            'Meta': {'ordering': "['title']", 'unique_together': "(('calendar', 'title'),)", 'object_name': 'BookingType'},
+            '_meta_title': ('django.db.models.fields.CharField', [], {'max_length': '500', 'null': 'True', 'blank': 'True'}),
+            'calendar': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['nowait.Calendar']", 'null': 'True', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'expiry_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'gen_description': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_sitemap': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'informations': ('mezzanine.core.fields.RichTextField', [], {'blank': 'True'}),
+            'intro': ('mezzanine.core.fields.RichTextField', [], {'blank': 'True'}),
+            #'keywords': ('mezzanine.generic.fields.KeywordsField', [], {'object_id_field': "'object_pk'", 'to': u"orm['generic.AssignedKeyword']", 'frozen_by_south': 'True'}),
+            'keywords_string': ('django.db.models.fields.CharField', [], {'max_length': '500', 'blank': 'True'}),
+            'link': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['pages.Link']", 'null': 'True', 'blank': 'True'}),
+            'notification_emails': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'to': u"orm['nowait.Email']", 'null': 'True', 'blank': 'True'}),
+            'notification_emails_enable': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'operators': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'}),
+            'publish_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'raw_location': ('django.db.models.fields.CharField', [], {'max_length': '500', 'blank': 'True'}),
+            'short_url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'null': 'True', 'blank': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slot_length': ('django.db.models.fields.PositiveIntegerField', [], {'default': '30'}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'null': 'True'})
+        },
+        u'nowait.calendar': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Calendar'},
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'description': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            'gid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '300', 'blank': 'True'}),
+            'gsummary': ('django.db.models.fields.CharField', [], {'max_length': '300', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '300'}),
+            'owner': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        },
+        u'nowait.dailyslottimepattern': {
+            'Meta': {'unique_together': "(('booking_type', 'day', 'start_time'),)", 'object_name': 'DailySlotTimePattern'},
+            'booking_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['nowait.BookingType']"}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'day': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'end_time': ('django.db.models.fields.TimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'start_time': ('django.db.models.fields.TimeField', [], {})
+        },
+        u'nowait.email': {
+            'Meta': {'ordering': "['email']", 'object_name': 'Email'},
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '75'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'notes': ('django.db.models.fields.CharField', [], {'max_length': '300', 'blank': 'True'})
+        },
+        u'nowait.slottime': {
+            'Meta': {'ordering': "['booking_type', 'start', 'end']", 'object_name': 'SlotTime'},
+            'booking_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['nowait.BookingType']"}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'end': ('django.db.models.fields.DateTimeField', [], {}),
+            'generation': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['nowait.SlotTimesGeneration']", 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {}),
+            'status': ('model_utils.fields.StatusField', [], {'default': "'free'", 'max_length': '100', u'no_check_for_status': 'True'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        },
+        u'nowait.slottimesgeneration': {
+            'Meta': {'object_name': 'SlotTimesGeneration'},
+            'booking_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['nowait.BookingType']"}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'end_date': ('django.db.models.fields.DateField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'start_date': ('django.db.models.fields.DateField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        },
+        u'pages.link': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'Link', '_ormbases': [u'pages.Page']},
+            u'page_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['pages.Page']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        u'pages.page': {
+            'Meta': {'ordering': "('titles',)", 'object_name': 'Page'},
+            '_meta_title': ('django.db.models.fields.CharField', [], {'max_length': '500', 'null': 'True', 'blank': 'True'}),
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_model': ('django.db.models.fields.CharField', [], {'max_length': '50', 'null': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'expiry_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'gen_description': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_menus': ('mezzanine.pages.fields.MenusField', [], {'default': '(1, 2, 3)', 'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'in_sitemap': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            #'keywords': ('mezzanine.generic.fields.KeywordsField', [], {'object_id_field': "'object_pk'", 'to': u"orm['generic.AssignedKeyword']", 'frozen_by_south': 'True'}),
+            'keywords_string': ('django.db.models.fields.CharField', [], {'max_length': '500', 'blank': 'True'}),
+            'login_required': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'children'", 'null': 'True', 'to': u"orm['pages.Page']"}),
+            'publish_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'short_url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'null': 'True', 'blank': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'titles': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'null': 'True'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'null': 'True'})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "('domain',)", 'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
     }
 
     complete_apps = ['nowait']
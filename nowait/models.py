@@ -1,21 +1,29 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import collections
 import logging
+import operator
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time
+from functools import reduce
 from smtplib import SMTPException
 
 from django.conf import settings
 from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.core.signals import got_request_exception, request_finished
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, connections, models
+from django.db.models.signals import post_delete, post_save, pre_save
 try:
     from django.db.transaction import atomic
 except ImportError:
     from django.db.transaction import commit_on_success as atomic
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
-from django.utils.timezone import (datetime, timedelta, make_aware,
-                                   get_current_timezone)
+from django.utils.timezone import (timedelta, make_aware, get_current_timezone,
+                                   localtime, now, utc)
 
 from mezzanine.core.fields import RichTextField
 from mezzanine.pages.models import Displayable, Link
@@ -24,7 +32,13 @@ from mezzanine.utils.email import send_mail_template, subject_template
 from model_utils import Choices
 from model_utils.models import TimeStampedModel, StatusField
 
-from .core import get_range_days, get_week_map_by_weekday
+from .cache import (atomic_invalidation, batch_invalidation, get_bitmap,
+                    invalidate_availability, invalidate_bitmaps,
+                    run_commit_invalidations, update_bitmap)
+from .core import (IntervalIndex, datetime_to_timestamp, exclude_overlapping,
+                   expand_slot_times, get_grid_step, get_local_timestamps,
+                   get_slot_position, iter_bitmap_positions, iter_range_days,
+                   merge_intervals, timestamp_to_datetime)
 from .utils import get_root_app_page
 
 
@@ -33,6 +47,8 @@ DAYS = Choices((0, 'mo', _('monday')), (1, 'tu', _('tuesday')),
                (4, 'fr', _('friday')), (5, 'sa', _('saturday')),
                (6, 'su', _('sunday')), )
 
+SLOTTIMES_BATCH_SIZE = 500
+
 
 @python_2_unicode_compatible
 class Calendar(TimeStampedModel):
@@ -87,6 +103,11 @@ class BookingType(Displayable):
     raw_location = models.CharField(_('Location (raw)'), max_length=500,
                                     blank=True)
     link = models.ForeignKey(Link, blank=True, null=True, editable=False)
+    virtual_slottimes = models.BooleanField(
+        _('virtual slot times'), default=False,
+        help_text=_('Compute the free slot times from the daily slot time'
+                    ' patterns instead of reading them from the database: a'
+                    ' slot time is stored only when it is booked.'))
 
     class Meta:
         ordering = ['title']
@@ -130,6 +151,150 @@ class BookingType(Displayable):
         emails += [email.email for email in self.notification_emails.all()]
         return emails
 
+    def get_virtual_slottimes(self, start, end):
+        """
+        Return the free slot times of this booking type starting after start
+        and ending before end, computed from its DailySlotTimePattern objects
+        without the ones overlapping SlotTime objects on the database or hit
+        by a Closure.
+
+        :return: list of unsaved SlotTime objects sorted by start
+        """
+        tz = get_current_timezone()
+        start_date, end_date = (start.astimezone(tz).date(),
+                                end.astimezone(tz).date())
+        starts, ends = expand_slot_times(
+            self.dailyslottimepattern_set.values_list(
+                'day', 'start_time', 'end_time'),
+            self.slot_length, start_date, end_date, tz)
+        if not starts:
+            return []
+        index = SlotTime.objects.get_index(self, start, end)
+        closures = Closure.objects.get_index(self, start_date, end_date, tz)
+        lower, upper = datetime_to_timestamp(start), datetime_to_timestamp(end)
+        return [SlotTime(booking_type=self,
+                         start=timestamp_to_datetime(slot_start, utc),
+                         end=timestamp_to_datetime(slot_end, utc))
+                for slot_start, slot_end in zip(starts, ends)
+                if slot_start > lower and slot_end < upper and
+                not index.overlaps(slot_start, slot_end) and
+                not closures.overlaps(slot_start, slot_end)]
+
+    def get_virtual_slottime(self, timestamp):
+        """
+        Return the free virtual slot time of this booking type starting at
+        the POSIX timestamp or None if it doesn't exist, is in the past or
+        is already stored on the database.
+        """
+        try:
+            start = timestamp_to_datetime(int(timestamp), utc)
+            end = start + timedelta(minutes=self.slot_length, seconds=1)
+        except (OverflowError, OSError, ValueError):
+            return None
+        if start <= now():
+            return None
+        for slottime in self.get_virtual_slottimes(
+                start - timedelta(seconds=1), end):
+            if slottime.start == start:
+                return slottime
+        return None
+
+    def get_availability_bitmap(self, month):
+        """
+        Return the availability bitmaps of the days of the month of the date
+        month, read from the cache or built with one query on the slot times
+        (or from the patterns for virtual slot times).
+
+        :return: (step, {day of the month: bitmap}) with the step in minutes
+                 of the grid of the bitmaps
+        """
+        month = month.replace(day=1)
+        return get_bitmap(self.pk, month,
+                          lambda: self._build_availability_bitmap(month))
+
+    def _build_availability_bitmap(self, month):
+        step = get_grid_step(self.slot_length, self.dailyslottimepattern_set.
+                             values_list('start_time', flat=True))
+        tz = get_current_timezone()
+        start = make_aware(datetime.combine(month, time()), tz)
+        end = make_aware(datetime.combine(
+            (month + timedelta(days=31)).replace(day=1), time()), tz)
+        if self.virtual_slottimes:
+            starts = [
+                slottime.start for slottime in self.get_virtual_slottimes(
+                    start - timedelta(seconds=1),
+                    end + timedelta(minutes=self.slot_length))
+                if slottime.start < end]
+        else:
+            starts = SlotTime.free.filter(
+                booking_type=self, start__gte=start,
+                start__lt=end).values_list('start', flat=True)
+        bitmaps = {}
+        for slot_start in starts:
+            local_start = localtime(slot_start)
+            bitmaps[local_start.day] = (
+                bitmaps.get(local_start.day, 0) |
+                1 << get_slot_position(step, local_start))
+        return step, bitmaps
+
+    def has_free_slottimes(self, day):
+        """
+        Return True if this booking type has free slot times in the date
+        day, reading its availability bitmap.
+        """
+        return bool(self.get_availability_bitmap(day)[1].get(day.day))
+
+    def get_free_slottimes_heatmap(self, month):
+        """
+        Return the number of free slot times of every day of the month of
+        the date month that has some, counted on its availability bitmap.
+
+        :rtype: dict of date: int
+        """
+        month = month.replace(day=1)
+        return dict((month.replace(day=day), bin(bitmap).count('1'))
+                    for day, bitmap in self.get_availability_bitmap(
+                        month)[1].items() if bitmap)
+
+    def get_earliest_free_start(self, start, months=12):
+        """
+        Return the aware datetime of the start of the first free slot time
+        of this booking type starting after start, looking in the
+        availability bitmaps of months months, or None if there isn't.
+        """
+        tz = get_current_timezone()
+        local_start = localtime(start, tz)
+        month = local_start.date().replace(day=1)
+        for i in range(0, months):
+            step, bitmaps = self.get_availability_bitmap(month)
+            for day in sorted(bitmaps):
+                date = month.replace(day=day)
+                bitmap = bitmaps[day]
+                if date < local_start.date():
+                    continue
+                if date == local_start.date():
+                    # the slot times at the position of start start before
+                    bitmap &= -1 << (
+                        get_slot_position(step, local_start) + 1)
+                # the local times of the positions of a day with a DST
+                # transition can be ambiguous or not exist
+                for timestamp in get_local_timestamps(tz, date, [
+                        position * step * 60
+                        for position in iter_bitmap_positions(bitmap)]):
+                    return timestamp_to_datetime(timestamp, tz)
+            month = (month + timedelta(days=31)).replace(day=1)
+        return None
+
+    def get_next_free_day(self, day):
+        """
+        Return the first date from day with free slot times of this booking
+        type, read from its DailyAvailability counters, or None if there
+        isn't. Virtual slot times aren't stored, so they have no counters.
+        """
+        days = DailyAvailability.objects.for_booking_type(
+            self, day).filter(free__gt=0).values_list('date', flat=True)[:1]
+        return days[0] if days else None
+
 
 @python_2_unicode_compatible
 class DailySlotTimePattern(TimeStampedModel):
@@ -149,13 +314,188 @@ class DailySlotTimePattern(TimeStampedModel):
                                   self.start_time, self.end_time)
 
 
+class ClosureManager(models.Manager):
+    def for_booking_type(self, booking_type, start_date, end_date):
+        """
+        Return the closures of booking_type or of its calendar overlapping
+        the days from start_date to end_date.
+        """
+        query = models.Q(booking_type=booking_type)
+        if booking_type.calendar_id:
+            query |= models.Q(calendar=booking_type.calendar_id)
+        return self.get_query_set().filter(
+            query, start_date__lte=end_date, end_date__gte=start_date)
+
+    def get_index(self, booking_type, start_date, end_date, tz):
+        """
+        Return an IntervalIndex of the POSIX timestamps of the windows closed
+        for booking_type between start_date and end_date, fetched with one
+        query. Overlapping closures are merged.
+        """
+        windows = []
+        for closure in self.for_booking_type(booking_type, start_date,
+                                             end_date):
+            windows.extend(closure.get_windows(tz, start_date, end_date))
+        return IntervalIndex(merge_intervals(windows))
+
+
+@python_2_unicode_compatible
+class Closure(TimeStampedModel):
+    calendar = models.ForeignKey(
+        Calendar, blank=True, null=True, verbose_name=_('calendar'),
+        help_text=_('Close all booking types of the calendar.'))
+    booking_type = models.ForeignKey(BookingType, blank=True, null=True,
+                                     verbose_name=_('booking type'))
+    start_date = models.DateField(_('start date'))
+    end_date = models.DateField(_('end date'))
+    start_time = models.TimeField(
+        _('start time'), blank=True, null=True,
+        help_text=_('Leave start time and end time empty to close whole'
+                    ' days.'))
+    end_time = models.TimeField(_('end time'), blank=True, null=True)
+    reason = models.CharField(_('reason'), max_length=300, blank=True)
+
+    objects = ClosureManager()
+
+    class Meta:
+        ordering = ['-start_date']
+        verbose_name = _('closure')
+        verbose_name_plural = _('closures')
+
+    def __str__(self):
+        return '%s %s - %s' % (self._meta.verbose_name, self.start_date,
+                               self.end_date)
+
+    def clean(self):
+        if bool(self.calendar_id) == bool(self.booking_type_id):
+            raise ValidationError(
+                _('Select either a calendar or a booking type.'))
+        if (self.start_date and self.end_date and
+                self.start_date > self.end_date):
+            raise ValidationError(
+                _('Start date must be less than or equal to end date.'))
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError(
+                _('Set both start time and end time or none of them.'))
+        if self.start_time is not None and self.start_time >= self.end_time:
+            raise ValidationError(_('Start time must be less than end time.'))
+
+    def get_windows(self, tz, start_date=None, end_date=None):
+        """
+        Return the list of the (start, end) POSIX timestamps of the windows
+        closed between start_date and end_date (by default the days of the
+        closure): one window for the whole range or, with start_time and
+        end_time, one for every day.
+        """
+        start_date = max(self.start_date, start_date or self.start_date)
+        end_date = min(self.end_date, end_date or self.end_date)
+        if start_date > end_date:
+            return []
+
+        def timestamp(day, value):
+            return datetime_to_timestamp(
+                make_aware(datetime.combine(day, value), tz))
+
+        if self.start_time is None:
+            return [(timestamp(start_date, time()),
+                     timestamp(end_date + timedelta(days=1), time()))]
+        return [(timestamp(day, self.start_time),
+                 timestamp(day, self.end_time))
+                for day in iter_range_days(start_date, end_date)]
+
+    def get_slottimes(self):
+        """
+        Return the queryset of the slot times hit by this closure.
+        """
+        queryset = SlotTime.objects.filter(reduce(operator.or_, [
+            models.Q(start__lt=timestamp_to_datetime(end, utc),
+                     end__gt=timestamp_to_datetime(start, utc))
+            for start, end in self.get_windows(get_current_timezone())]))
+        if self.booking_type_id:
+            return queryset.filter(booking_type=self.booking_type_id)
+        return queryset.filter(booking_type__calendar=self.calendar_id)
+
+    def prune_slottimes(self):
+        """
+        Delete with one query the free slot times hit by this closure.
+
+        :return: tuple with the number of deleted slot times and the list of
+                 the taken slot times hit by this closure, which are left to
+                 the operators
+        """
+        with atomic_invalidation():
+            slottimes = self.get_slottimes()
+            taken = list(slottimes.filter(
+                status=SlotTime.STATUS.taken).select_related('booking_type'))
+            free = slottimes.filter(status=SlotTime.STATUS.free)
+            deleted = free.count()
+            with batch_invalidation(), batch_counting():
+                free.delete()
+        return deleted, taken
+
+
+class SlotTimesGenerationManager(models.Manager):
+    def queue(self, generations, regenerate=False):
+        """
+        Mark generations as queued and run them in parallel: one Celery
+        subtask for every booking type, which runs its generations in
+        sequence (they would contend for the same slot times), and a final
+        task that collects the summary of counts and timings.
+
+        :return: the AsyncResult of the summary task or None if generations
+                 is empty
+        """
+        from celery import chord
+        from .tasks import (generate_booking_type_slot_times,
+                            summarize_slot_times_generations)
+        by_booking_type = {}
+        for generation in generations:
+            generation.mark_queued()
+            by_booking_type.setdefault(generation.booking_type_id, []).append(
+                generation.pk)
+        if not by_booking_type:
+            return None
+        return chord(
+            generate_booking_type_slot_times.s(pks, regenerate=regenerate)
+            for pks in by_booking_type.values())(
+            summarize_slot_times_generations.s())
+
+    def store_summaries(self, summaries):
+        """
+        Store on every generation its summary, a dict (generation, status,
+        count, seconds) built by generate_booking_type_slot_times, shown to
+        the operators in the admin.
+        """
+        for summary in summaries:
+            if summary['count'] is None:
+                text = _('failed after %(seconds)ss') % summary
+            else:
+                text = _('%(count)s slot times in %(seconds)ss') % summary
+            self.filter(pk=summary['generation']).update(
+                summary=text, modified=now())
+
+
 @python_2_unicode_compatible
 class SlotTimesGeneration(TimeStampedModel):
+    STATUS = Choices(('pending', _('pending')), ('queued', _('queued')),
+                     ('running', _('running')), ('done', _('done')),
+                     ('failed', _('failed')))
     booking_type = models.ForeignKey(BookingType)
     start_date = models.DateField(_('start date'))
     end_date = models.DateField(_('end date'))
     user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True,
                              editable=False, verbose_name=_('user'))
+    status = StatusField(_('status'), default=STATUS.pending, editable=False)
+    slottimes_done = models.PositiveIntegerField(
+        _('slot times done'), default=0, editable=False)
+    slottimes_total = models.PositiveIntegerField(
+        _('slot times total'), default=0, editable=False)
+    errors = models.TextField(_('errors'), blank=True, default='',
+                              editable=False)
+    summary = models.CharField(_('summary'), max_length=200, blank=True,
+                               default='', editable=False)
+
+    objects = SlotTimesGenerationManager()
 
     class Meta:
         verbose_name = _('slot times generation')
@@ -164,47 +504,336 @@ class SlotTimesGeneration(TimeStampedModel):
     def __str__(self):
         return '%s n.%s' % (self._meta.verbose_name, self.pk)
 
-    def create_slot_times(self):
-        try:
-            days = get_week_map_by_weekday(
-                get_range_days(self.start_date, self.end_date))
-        except Exception as e:
-            raise e
-
-        if self.booking_type.dailyslottimepattern_set.count() == 0:
+    def get_slot_time_arrays(self):
+        """
+        Return the SlotTimeArrays (POSIX timestamps of start and end) of all
+        slot times described by the DailySlotTimePattern objects of
+        self.booking_type between self.start_date and self.end_date, without
+        the ones hit by a Closure.
+        """
+        patterns = list(
+            self.booking_type.dailyslottimepattern_set.values_list(
+                'day', 'start_time', 'end_time'))
+        if not patterns:
             raise ValueError("{title} has no related DailySlotTimePattern "
                              "objects".format(title=self.booking_type.title))
+        tz = get_current_timezone()
+        return exclude_overlapping(
+            expand_slot_times(patterns, self.booking_type.slot_length,
+                              self.start_date, self.end_date, tz),
+            Closure.objects.get_index(self.booking_type, self.start_date,
+                                      self.end_date, tz))
+
+    def preview_slot_times(self):
+        """
+        Compute what bulk_create_slot_times would do, without writing
+        anything: the expansion of the patterns is checked in memory against
+        one snapshot of the slot times of the range.
+
+        :return: dict with the number of slot times described by the
+                 patterns ('total'), the ones that would be created
+                 ('created'), skipped because already existing
+                 ('duplicates') and rejected because overlapping other slot
+                 times ('overlaps')
+        """
+        starts, ends = self.get_slot_time_arrays()
+        result = {'total': len(starts), 'created': 0, 'duplicates': 0,
+                  'overlaps': 0}
+        if not starts:
+            return result
+        existing = [
+            (datetime_to_timestamp(start), datetime_to_timestamp(end))
+            for start, end in SlotTime.objects.filter(
+                booking_type=self.booking_type,
+                start__lt=timestamp_to_datetime(max(ends), utc),
+                end__gt=timestamp_to_datetime(min(starts), utc)).values_list(
+                'start', 'end')]
+        index, existing = IntervalIndex(existing), set(existing)
+        for key in zip(starts, ends):
+            if key in existing:
+                result['duplicates'] += 1
+            elif index.add(*key):
+                result['created'] += 1
+            else:
+                result['overlaps'] += 1
+        return result
+
+    def get_slot_times(self):
+        """
+        Yield the (start, end) tuples of aware datetimes of all slot times
+        of this generation.
+        """
+        starts, ends = self.get_slot_time_arrays()
+        for start, end in zip(starts, ends):
+            yield (timestamp_to_datetime(start, utc),
+                   timestamp_to_datetime(end, utc))
+
+    def create_slot_times(self, bulk=False, batch_size=SLOTTIMES_BATCH_SIZE):
+        """
+        Create the SlotTime objects of this generation and return a tuple
+        with the number of created objects.
+
+        With bulk=True the slot times are written through
+        bulk_create_slot_times instead of one get_or_create for slot.
+        """
+        if bulk:
+            return self.bulk_create_slot_times(batch_size=batch_size)
 
         count = 0
-        for pattern in self.booking_type.dailyslottimepattern_set.all():
-            for day in days[str(pattern.day)]:
-                cache_start_datetime = make_aware(
-                    datetime.combine(day, pattern.start_time),
-                    get_current_timezone())
-                end_datetime = make_aware(
-                    datetime.combine(day, pattern.end_time),
-                    get_current_timezone())
-                while (((end_datetime - cache_start_datetime).seconds / 60)
-                        >= pattern.booking_type.slot_length):
-                    start_slot = cache_start_datetime
-                    end_slot = cache_start_datetime + timedelta(
-                        minutes=pattern.booking_type.slot_length)
-                    try:
-                        slot, created = (
-                            self.slottime_set.get_or_create(
-                                booking_type=pattern.booking_type,
-                                start=start_slot,
-                                end=end_slot,
-                                user=self.user))
-                        if created:
-                            count += 1
-                    except ValidationError:
-                        pass
-                    cache_start_datetime = end_slot
+        for start_slot, end_slot in self.get_slot_times():
+            try:
+                slot, created = (
+                    self.slottime_set.get_or_create(
+                        booking_type=self.booking_type,
+                        start=start_slot,
+                        end=end_slot,
+                        user=self.user))
+                if created:
+                    count += 1
+            except ValidationError:
+                pass
         return count,
 
+    def bulk_create_slot_times(self, batch_size=SLOTTIMES_BATCH_SIZE,
+                               progress=None):
+        """
+        Compute all slot times of this generation in memory, drop the ones
+        that overlap with already existing SlotTime objects (fetched with
+        one range query) and write the others with chunked bulk_create.
+
+        Every chunk is committed in its own transaction, so the progress is
+        visible outside of the running generation; a generation interrupted
+        can be run again because the slot times already written are skipped.
+
+        :param progress: optional callable called with the number of written
+                         slot times and the number of slot times to write
+                         after every chunk
+        :return: tuple with the number of created objects
+        """
+        starts, ends = self.get_slot_time_arrays()
+        if not starts:
+            return 0,
+
+        index = SlotTime.objects.get_index(
+            self.booking_type, timestamp_to_datetime(min(starts), utc),
+            timestamp_to_datetime(max(ends), utc))
+        slots = [(start, end) for start, end in zip(starts, ends)
+                 if index.add(start, end)]
+        return self._write_slot_times(slots, batch_size, progress),
+
+    def regenerate_slot_times(self, batch_size=SLOTTIMES_BATCH_SIZE,
+                              progress=None):
+        """
+        Align the free slot times of self.booking_type between
+        self.start_date and self.end_date to the current
+        DailySlotTimePattern objects.
+
+        The existing slot times of the range are fetched with one query and
+        compared with the expansion of the patterns: the missing slot times
+        are written with chunked bulk_create and the free slot times no more
+        described by the patterns are deleted in chunks. Taken slot times are
+        never deleted, and no slot time overlapping them is created.
+
+        :param progress: optional callable, see bulk_create_slot_times
+        :return: tuple with the number of created and deleted objects
+        """
+        starts, ends = self.get_slot_time_arrays()
+        tz = get_current_timezone()
+        window_start = make_aware(
+            datetime.combine(self.start_date, time()), tz)
+        window_end = make_aware(datetime.combine(
+            self.end_date + timedelta(days=1), time()), tz)
+
+        expected = set(zip(starts, ends))
+        index, orphans = IntervalIndex(), []
+        for pk, start, end, status in SlotTime.objects.filter(
+                booking_type=self.booking_type, start__lt=window_end,
+                end__gt=window_start).values_list(
+                'pk', 'start', 'end', 'status'):
+            key = datetime_to_timestamp(start), datetime_to_timestamp(end)
+            if (status == SlotTime.STATUS.free and start >= window_start and
+                    key not in expected):
+                orphans.append(pk)
+            else:
+                index.add(*key)
+
+        deleted = 0
+        for offset in range(0, len(orphans), batch_size):
+            with batch_invalidation(), atomic(), batch_counting():
+                # status is filtered again to never touch slot times taken
+                # after the query above
+                queryset = SlotTime.free.filter(
+                    pk__in=orphans[offset:offset + batch_size])
+                deleted += queryset.count()
+                queryset.delete()
+        slots = [(start, end) for start, end in sorted(expected)
+                 if index.add(start, end)]
+        return self._write_slot_times(slots, batch_size, progress), deleted
+
+    def _write_slot_times(self, slots, batch_size, progress):
+        new_slottimes = [
+            SlotTime(generation=self, booking_type=self.booking_type,
+                     start=timestamp_to_datetime(start, utc),
+                     end=timestamp_to_datetime(end, utc), user=self.user)
+            for start, end in slots]
+        total = len(new_slottimes)
+        if progress:
+            progress(0, total)
+        created = 0
+        for index in range(0, total, batch_size):
+            chunk = new_slottimes[index:index + batch_size]
+            created += SlotTime.objects.bulk_insert(self.booking_type, chunk)
+            if progress:
+                progress(index + len(chunk), total)
+        return created
+
+    def update_progress(self, done, total):
+        self.update_state(slottimes_done=done, slottimes_total=total)
+
+    def update_state(self, **fields):
+        """
+        Update fields of this generation on the database without touching
+        the others, that can be changed meanwhile by a running generation.
+        """
+        for name, value in fields.items():
+            setattr(self, name, value)
+        fields['modified'] = now()
+        SlotTimesGeneration.objects.filter(pk=self.pk).update(**fields)
+
+    def mark_queued(self):
+        self.update_state(status=self.STATUS.queued, slottimes_done=0,
+                          slottimes_total=0, errors='', summary='')
+
+    def generate(self, regenerate=False):
+        """
+        Create the slot times of this generation with the bulk mode (or
+        align them to the patterns with regenerate=True), keeping track on
+        the database of status, progress and errors.
+
+        :return: the number of created slot times or None on errors
+        """
+        self.update_state(status=self.STATUS.running, errors='')
+        try:
+            if regenerate:
+                count = self.regenerate_slot_times(
+                    progress=self.update_progress)[0]
+            else:
+                count, = self.bulk_create_slot_times(
+                    progress=self.update_progress)
+        except Exception as e:
+            self.update_state(status=self.STATUS.failed, errors=str(e))
+            logger = logging.getLogger('nowait')
+            logger.exception('Error on %s', self)
+            return None
+        self.update_state(status=self.STATUS.done)
+        return count
+
+
+class SlotTimeManager(models.Manager):
+    OVERLAP_CONSTRAINT = 'nowait_slottime_no_overlap'
+    # (alias, database name) -> True if the constraint exists
+    _overlap_constraints = {}
+
+    def has_overlap_constraint(self):
+        """
+        Return True if the database rejects overlapping slot times of the
+        same booking type by itself: the exclusion constraint added by the
+        slottime_no_overlap migration exists only on PostgreSQL databases
+        migrated by South, not on the ones created by syncdb. The lookup in
+        the catalog is made once for every database.
+        """
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            return False
+        key = (self.db, connection.settings_dict['NAME'])
+        if key not in self._overlap_constraints:
+            cursor = connection.cursor()
+            cursor.execute(
+                'SELECT 1 FROM pg_constraint WHERE conname = %s'
+                ' AND conrelid = %s::regclass',
+                [self.OVERLAP_CONSTRAINT, self.model._meta.db_table])
+            self._overlap_constraints[key] = cursor.fetchone() is not None
+        return self._overlap_constraints[key]
+
+    def bulk_insert(self, booking_type, slottimes):
+        """
+        Insert slot times of booking_type with one bulk_create in a single
+        transaction, never writing a slot time that overlaps another one.
+
+        On PostgreSQL the exclusion constraint guarantees it: the chunk is
+        inserted as is and only if it's rejected the guarded path below is
+        used. On other databases the row of booking_type is locked, so
+        concurrent generations of the same booking type are serialized, and
+        the chunk is checked again against the slot times on the database
+        before the insert.
+
+        :return: the number of inserted slot times
+        """
+        if not slottimes:
+            return 0
+        # bulk_create sends no post_save signal: the availability of
+        # booking_type is invalidated at the end of the block, after commit
+        with batch_invalidation():
+            invalidate_availability(booking_type.pk)
+            invalidate_bitmaps(booking_type.pk)
+            if self.has_overlap_constraint():
+                try:
+                    with atomic():
+                        self.bulk_create(slottimes)
+                        DailyAvailability.objects.add(
+                            booking_type.pk,
+                            [obj.start for obj in slottimes], free=1)
+                    return len(slottimes)
+                except IntegrityError:
+                    pass
+            with atomic():
+                list(BookingType.objects.select_for_update().filter(
+                    pk=booking_type.pk).values_list('pk', flat=True))
+                index = self.get_index(booking_type,
+                                       min(obj.start for obj in slottimes),
+                                       max(obj.end for obj in slottimes))
+                slottimes = [obj for obj in slottimes if index.add(
+                    datetime_to_timestamp(obj.start),
+                    datetime_to_timestamp(obj.end))]
+                self.bulk_create(slottimes)
+                DailyAvailability.objects.add(
+                    booking_type.pk, [obj.start for obj in slottimes], free=1)
+            return len(slottimes)
+
+    def get_index(self, booking_type, start, end):
+        """
+        Return an IntervalIndex of the POSIX timestamps of the slot times of
+        booking_type overlapping the range from start to end, fetched with
+        one query.
+        """
+        slots = self.get_query_set().filter(
+            booking_type=booking_type, start__lt=end,
+            end__gt=start).values_list('start', 'end')
+        return IntervalIndex(
+            (datetime_to_timestamp(start), datetime_to_timestamp(end))
+            for start, end in slots)
+
+    def overlaps(self, booking_type, start, end, exclude_pk=None):
+        """
+        Return True if a slot time of booking_type overlaps the range from
+        start to end.
+
+        Slot times of a booking type don't overlap each other, so only the
+        last one starting before end has to be checked: it's fetched with an
+        index-backed lookup on (booking_type, start).
+        """
+        queryset = self.get_query_set().filter(booking_type=booking_type,
+                                               start__lt=end)
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        previous_end = list(queryset.order_by('-start').values_list(
+            'end', flat=True)[:1])
+        return bool(previous_end) and previous_end[0] > start
+
 
 class FreeSlotTimeManager(models.Manager):
+    VIRTUAL_PAGE_DAYS = 31
+
     def get_query_set(self):
         return super(FreeSlotTimeManager, self).get_query_set().filter(
             status=SlotTime.STATUS.free)
@@ -216,6 +845,151 @@ class FreeSlotTimeManager(models.Manager):
             start__gt=start + timedelta(days=days_start),
             end__lt=start + timedelta(days=days_end)).order_by('start')
 
+    def get_page_for_booking(self, booking_type, start, end, after=None,
+                             limit=100):
+        """
+        Return a page of at most limit free slot times of booking_type
+        starting after start and ending before end, ordered by start and id,
+        and the cursor of the next page.
+
+        The cursor is the (start, id) of the last slot time of the page and
+        the next page is the one after it: the page is fetched with a keyset
+        condition on the (booking_type, start) index instead of an OFFSET,
+        so it costs the same however far in the future it is. Virtual slot
+        times have id None and are computed in windows of
+        VIRTUAL_PAGE_DAYS days from the cursor.
+
+        :param after: cursor returned with the previous page or None
+        :return: (list of SlotTime, cursor of the next page or None if this
+                 is the last one)
+        """
+        if booking_type.virtual_slottimes:
+            slottimes = self._get_virtual_page(booking_type, start, end,
+                                               after, limit)
+        else:
+            qs = self.get_query_set().filter(
+                booking_type=booking_type, start__gt=start, end__lt=end)
+            if after is not None:
+                after_start, after_pk = after
+                qs = qs.filter(
+                    models.Q(start__gt=after_start) |
+                    models.Q(start=after_start, pk__gt=after_pk))
+            slottimes = list(qs.order_by('start', 'pk')[:limit + 1])
+        if len(slottimes) <= limit:
+            return slottimes, None
+        slottimes = slottimes[:limit]
+        return slottimes, (slottimes[-1].start, slottimes[-1].pk)
+
+    def _get_virtual_page(self, booking_type, start, end, after, limit):
+        last = after[0] if after is not None else None
+        lower = max(start, last) if last is not None else start
+        slottimes = []
+        while lower < end and len(slottimes) <= limit:
+            upper = min(lower + timedelta(days=self.VIRTUAL_PAGE_DAYS), end)
+            for slottime in booking_type.get_virtual_slottimes(lower, upper):
+                if last is None or slottime.start > last:
+                    slottimes.append(slottime)
+                    last = slottime.start
+            if upper >= end:
+                break
+            # the slot times across upper are found in the next window
+            lower = upper - timedelta(minutes=booking_type.slot_length,
+                                      seconds=1)
+        return slottimes[:limit + 1]
+
+    def get_next_available(self, booking_types, start, end, limit=10):
+        """
+        Return the first limit free slot times of any of booking_types
+        starting after start and ending before end, sorted by start.
+
+        The slot times on the database are read with one query: an
+        "ORDER BY start LIMIT limit" scan of the (booking_type, start) index
+        for every booking type, joined with UNION ALL and merged by the
+        database, so its cost doesn't grow with the slot times of the
+        booking types. The virtual slot times are merged in Python.
+
+        :rtype: list of SlotTime
+        """
+        booking_types = list(booking_types)
+        stored = [booking_type.pk for booking_type in booking_types
+                  if not booking_type.virtual_slottimes]
+        slottimes = []
+        if stored:
+            params = []
+            for booking_type_id in stored:
+                params.extend([booking_type_id, SlotTime.STATUS.free, start,
+                               end, limit])
+            slottimes.extend(self.raw(
+                self._get_next_available_sql(len(stored)), params + [limit]))
+        for booking_type in booking_types:
+            if booking_type.virtual_slottimes:
+                slottimes.extend(self.get_page_for_booking(
+                    booking_type, start, end, limit=limit)[0])
+        slottimes.sort(key=lambda slottime: (slottime.start,
+                                             slottime.booking_type_id))
+        return slottimes[:limit]
+
+    def _get_next_available_sql(self, count):
+        qn = connections[self.db].ops.quote_name
+        opts = self.model._meta
+        columns = dict((name, qn(opts.get_field(name).column)) for name in
+                       ('booking_type', 'status', 'start', 'end'))
+        # every scan is wrapped in a subquery, SQLite doesn't accept ORDER
+        # BY and LIMIT in the members of a UNION ALL
+        scan = ('SELECT * FROM (SELECT * FROM {table} WHERE {booking_type} ='
+                ' %s AND {status} = %s AND {start} > %s AND {end} < %s ORDER'
+                ' BY {start} LIMIT %s) {alias}')
+        scans = ' UNION ALL '.join(
+            scan.format(table=qn(opts.db_table), alias=qn('scan_%s' % i),
+                        **columns) for i in range(0, count))
+        return ('SELECT * FROM ({scans}) {alias} ORDER BY {start}, '
+                '{booking_type} LIMIT %s'.format(
+                    scans=scans, alias=qn('next_available'), **columns))
+
+    def get_nearest(self, booking_type, start, limit=5):
+        """
+        Return the limit free slot times of booking_type in the future with
+        the start nearest to start, sorted by start: the alternatives to a
+        slot time starting at start that has been taken.
+        """
+        lower = max(start - timedelta(days=self.VIRTUAL_PAGE_DAYS), now())
+        if booking_type.virtual_slottimes:
+            before = [slottime for slottime in
+                      booking_type.get_virtual_slottimes(
+                          lower, start + timedelta(
+                              minutes=booking_type.slot_length))
+                      if slottime.start < start][-limit:]
+        else:
+            before = self.get_query_set().filter(
+                booking_type=booking_type, start__gt=lower,
+                start__lt=start).order_by('-start')[:limit]
+        nearest = list(before) + self.get_next_available(
+            [booking_type], max(start, lower),
+            start + timedelta(days=366), limit=limit)
+        nearest.sort(key=lambda slottime: abs(slottime.start - start))
+        return sorted(nearest[:limit], key=lambda slottime: slottime.start)
+
+    def get_virtual_for_booking(self, booking_type, start, days_start=1,
+                                days_end=95):
+        """
+        Like get_for_booking but for booking types with virtual slot times:
+        return a list of unsaved SlotTime objects computed from the patterns.
+        """
+        return booking_type.get_virtual_slottimes(
+            start + timedelta(days=days_start),
+            start + timedelta(days=days_end))
+
+
+class SlotTimeTaken(Exception):
+    """
+    Raised claiming a slot time that isn't free anymore.
+    """
+
+    def __init__(self, slottime):
+        super(SlotTimeTaken, self).__init__(
+            'Slot time {0} is already taken'.format(slottime.pk))
+        self.slottime = slottime
+
 
 class TakenSlotTimeManager(models.Manager):
     def get_query_set(self):
@@ -236,7 +1010,7 @@ class SlotTime(TimeStampedModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True,
                              verbose_name=_('user'))
 
-    objects = models.Manager()
+    objects = SlotTimeManager()
     free = FreeSlotTimeManager()
     taken = TakenSlotTimeManager()
 
@@ -244,14 +1018,23 @@ class SlotTime(TimeStampedModel):
         verbose_name = _('slot time')
         verbose_name_plural = _('slot times')
         ordering = ['booking_type', 'start', 'end']
+        index_together = [['booking_type', 'start']]
 
     def __str__(self):
         return ('{self._meta.verbose_name} {self.start:%A %d %B %Y %H:%M}'
                 ' - {self.end:%A %d %B %Y %H:%M}'.format(self=self))
 
+    def get_booking_url(self):
+        if self.pk:
+            return reverse('nowait:booking_create',
+                           kwargs={'slottime_pk': self.pk})
+        return reverse('nowait:booking_create_virtual',
+                       kwargs={'slug': self.booking_type.slug,
+                               'timestamp': datetime_to_timestamp(self.start)})
+
     def clean(self):
-        if SlotTime.objects.exclude(pk=self.pk).filter(
-                start__lte=self.start, end__gt=self.start).count() > 0:
+        if SlotTime.objects.overlaps(self.booking_type_id, self.start,
+                                     self.end, exclude_pk=self.pk):
             raise ValidationError(
                 "Tring to insert an %s object that"
                 " overlaps with other." % self._meta.verbose_name.capitalize())
@@ -263,6 +1046,152 @@ class SlotTime(TimeStampedModel):
             force_insert=force_insert, force_update=force_update, using=using,
             update_fields=update_fields)
 
+    def take(self):
+        """
+        Claim this free slot time, with one conditional UPDATE setting its
+        status to taken only if it's still free: of concurrent claims only
+        one succeeds, without locks. A virtual slot time is instead written
+        as taken, and rejected if meanwhile an overlapping one is stored:
+        without the exclusion constraint the row of its booking type is
+        locked, as in SlotTimeManager.bulk_insert, and the overlap is
+        checked again by save() under the lock.
+
+        :raise SlotTimeTaken: if the slot time isn't free anymore
+        """
+        if self.pk is None:
+            self.status = self.STATUS.taken
+            try:
+                with atomic():
+                    if not SlotTime.objects.has_overlap_constraint():
+                        list(BookingType.objects.select_for_update().filter(
+                            pk=self.booking_type_id).values_list(
+                            'pk', flat=True))
+                    self.save()
+            except (ValidationError, IntegrityError):
+                raise SlotTimeTaken(self)
+            return
+        modified = now()
+        if not SlotTime.objects.filter(
+                pk=self.pk, status=self.STATUS.free).update(
+                status=self.STATUS.taken, modified=modified):
+            raise SlotTimeTaken(self)
+        # update() sends no signal: the receivers keeping the counters, the
+        # bitmaps and the availability cache are run as for a save()
+        self._counted = (self.booking_type_id, self.start, self.STATUS.free)
+        self.status, self.modified = self.STATUS.taken, modified
+        post_save.send(sender=SlotTime, instance=self, created=False,
+                       raw=False, using=self._state.db,
+                       update_fields=['status', 'modified'])
+
+
+class DailyAvailabilityManager(models.Manager):
+    def for_booking_type(self, booking_type, start_date, end_date=None):
+        queryset = self.get_query_set().filter(
+            booking_type=booking_type, date__gte=start_date)
+        if end_date is not None:
+            queryset = queryset.filter(date__lte=end_date)
+        return queryset.order_by('date')
+
+    def add(self, booking_type_id, starts, free=0, taken=0):
+        """
+        Add free and taken (negative to subtract) for every datetime of
+        starts to the counters of its local day, with one UPDATE for every
+        day (or an INSERT for the days without counters, only when adding:
+        the counters of a booking type being deleted aren't created again).
+
+        The INSERT is made in a savepoint: if a concurrent write creates the
+        counters of the same day meanwhile, they're updated instead.
+        """
+        days = collections.Counter(localtime(start).date() for start in starts)
+        for day, count in days.items():
+            queryset = self.get_query_set().filter(
+                booking_type=booking_type_id, date=day)
+            changes = {'free': models.F('free') + free * count,
+                       'taken': models.F('taken') + taken * count}
+            if queryset.update(**changes) or free < 0 or taken < 0:
+                continue
+            try:
+                with atomic():
+                    self.create(booking_type_id=booking_type_id, date=day,
+                                free=free * count, taken=taken * count)
+            except IntegrityError:
+                queryset.update(**changes)
+
+    def rebuild(self, booking_type=None):
+        """
+        Rebuild from scratch the counters of booking_type (or of all booking
+        types) reading the slot times with one query.
+
+        :return: the number of written DailyAvailability objects
+        """
+        slottimes = SlotTime.objects.all()
+        queryset = self.get_query_set()
+        if booking_type is not None:
+            slottimes = slottimes.filter(booking_type=booking_type)
+            queryset = queryset.filter(booking_type=booking_type)
+        counters = {}
+        for booking_type_id, start, status in slottimes.values_list(
+                'booking_type_id', 'start', 'status').iterator():
+            counter = counters.setdefault(
+                (booking_type_id, localtime(start).date()), [0, 0])
+            counter[status == SlotTime.STATUS.taken] += 1
+        with atomic():
+            queryset.delete()
+            self.bulk_create([
+                DailyAvailability(booking_type_id=booking_type_id, date=day,
+                                  free=free, taken=taken)
+                for (booking_type_id, day), (free, taken)
+                in counters.items()])
+        return len(counters)
+
+
+_counting = threading.local()
+
+
+@contextmanager
+def batch_counting():
+    """
+    Context manager that collects the changes of the daily counters sent by
+    the post_delete signal of every deleted slot time and writes them at the
+    end of the block, with one UPDATE for every day.
+    """
+    if getattr(_counting, 'deleted', None) is not None:
+        yield
+        return
+    _counting.deleted = collections.defaultdict(list)
+    try:
+        yield
+        for (booking_type_id, status), starts in _counting.deleted.items():
+            DailyAvailability.objects.add(booking_type_id, starts,
+                                          **{status: -1})
+    finally:
+        _counting.deleted = None
+
+
+@python_2_unicode_compatible
+class DailyAvailability(models.Model):
+    """
+    Counters of the free and taken slot times of a booking type in a day,
+    kept up to date by the writes of slot times.
+    """
+    booking_type = models.ForeignKey(BookingType,
+                                     verbose_name=_('booking type'))
+    date = models.DateField(_('date'))
+    free = models.IntegerField(_('free slot times'), default=0)
+    taken = models.IntegerField(_('taken slot times'), default=0)
+
+    objects = DailyAvailabilityManager()
+
+    class Meta:
+        verbose_name = _('daily availability')
+        verbose_name_plural = _('daily availabilities')
+        ordering = ['booking_type', 'date']
+        unique_together = ('booking_type', 'date')
+
+    def __str__(self):
+        return '%s %s: %s/%s' % (self.booking_type_id, self.date, self.free,
+                                 self.free + self.taken)
+
 
 @python_2_unicode_compatible
 class Booking(TimeStampedModel):
@@ -281,17 +1210,24 @@ class Booking(TimeStampedModel):
     class Meta:
         verbose_name = _('booking')
         verbose_name_plural = _('bookings')
+        index_together = [['booker', 'created']]
 
     def __str__(self):
         return '%s n.%s' % (self._meta.verbose_name, self.pk)
 
-    @atomic
     def save_and_take_slottime(self, slottime, request):
-        self.slottime = slottime
-        self.booker = request.user
-        self.save()
-        self.slottime.status = SlotTime.STATUS.taken
-        self.slottime.save()
+        """
+        Take slottime and save this booking of the user of request, in one
+        transaction.
+
+        :raise SlotTimeTaken: if slottime has been taken meanwhile by
+                              another booking
+        """
+        with atomic_invalidation():
+            slottime.take()
+            self.slottime = slottime
+            self.booker = request.user
+            self.save()
 
     @property
     def success_message_on_creation(self):
@@ -319,3 +1255,112 @@ class Booking(TimeStampedModel):
                     'Internal Server Error: %s', request.path,
                     exc_info=str(e),
                     extra={'status_code': 500, 'request': request})
+
+
+def invalidate_booking_type_availability(sender, instance, **kwargs):
+    invalidate_availability(instance.booking_type_id)
+
+
+def invalidate_booking_availability(sender, instance, **kwargs):
+    try:
+        invalidate_availability(instance.slottime.booking_type_id)
+    except SlotTime.DoesNotExist:
+        pass
+
+
+def invalidate_closure_availability(sender, instance, **kwargs):
+    if instance.booking_type_id:
+        invalidate_availability(instance.booking_type_id)
+        invalidate_bitmaps(instance.booking_type_id)
+        return
+    with batch_invalidation():
+        for booking_type_id in BookingType.objects.filter(
+                calendar=instance.calendar_id).values_list('pk', flat=True):
+            invalidate_availability(booking_type_id)
+            invalidate_bitmaps(booking_type_id)
+
+
+def invalidate_own_availability(sender, instance, **kwargs):
+    invalidate_availability(instance.pk)
+    invalidate_bitmaps(instance.pk)
+
+
+def invalidate_pattern_bitmaps(sender, instance, **kwargs):
+    invalidate_bitmaps(instance.booking_type_id)
+
+
+for signal in (post_save, post_delete):
+    for model in (SlotTime, SlotTimesGeneration, DailySlotTimePattern):
+        signal.connect(invalidate_booking_type_availability, sender=model)
+    signal.connect(invalidate_booking_availability, sender=Booking)
+    signal.connect(invalidate_closure_availability, sender=Closure)
+    signal.connect(invalidate_own_availability, sender=BookingType)
+    signal.connect(invalidate_pattern_bitmaps, sender=DailySlotTimePattern)
+
+
+def load_counted_slottime(sender, instance, raw=False, **kwargs):
+    instance._counted = None
+    if instance.pk and not raw:
+        counted = list(SlotTime.objects.filter(pk=instance.pk).values_list(
+            'booking_type_id', 'start', 'status')[:1])
+        instance._counted = counted[0] if counted else None
+
+
+def count_saved_slottime(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    counted = (instance.booking_type_id, instance.start, instance.status)
+    if counted == getattr(instance, '_counted', None):
+        return
+    if getattr(instance, '_counted', None):
+        booking_type_id, start, status = instance._counted
+        DailyAvailability.objects.add(booking_type_id, [start],
+                                      **{status: -1})
+    DailyAvailability.objects.add(instance.booking_type_id, [instance.start],
+                                  **{instance.status: 1})
+
+
+def count_deleted_slottime(sender, instance, **kwargs):
+    deleted = getattr(_counting, 'deleted', None)
+    if deleted is not None:
+        deleted[instance.booking_type_id, instance.status].append(
+            instance.start)
+        return
+    DailyAvailability.objects.add(instance.booking_type_id, [instance.start],
+                                  **{instance.status: -1})
+
+
+def update_saved_slottime_bitmap(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    counted = getattr(instance, '_counted', None)
+    if counted == (instance.booking_type_id, instance.start, instance.status):
+        return
+    if counted and counted[:2] != (instance.booking_type_id, instance.start):
+        update_bitmap(counted[0], counted[1], free=False)
+    update_bitmap(instance.booking_type_id, instance.start,
+                  free=instance.status == SlotTime.STATUS.free)
+
+
+def update_deleted_slottime_bitmap(sender, instance, **kwargs):
+    update_bitmap(instance.booking_type_id, instance.start, free=False)
+
+
+def run_request_invalidations(sender, **kwargs):
+    # the transaction of ATOMIC_REQUESTS is committed before the end of the
+    # request
+    run_commit_invalidations()
+
+
+def discard_request_bitmaps(sender, **kwargs):
+    # the transaction of ATOMIC_REQUESTS is rolled back by the exception
+    run_commit_invalidations(committed=False)
+
+
+request_finished.connect(run_request_invalidations)
+got_request_exception.connect(discard_request_bitmaps)
+pre_save.connect(load_counted_slottime, sender=SlotTime)
+post_save.connect(count_saved_slottime, sender=SlotTime)
+post_delete.connect(count_deleted_slottime, sender=SlotTime)
+post_save.connect(update_saved_slottime_bitmap, sender=SlotTime)
+post_delete.connect(update_deleted_slottime_bitmap, sender=SlotTime)
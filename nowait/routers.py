@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Database router that sends the reads of the public nowait views to a read
+replica.
+
+Enable it in the settings of the project::
+
+    DATABASE_ROUTERS = ['nowait.routers.ReplicaRouter']
+    NOWAIT_READ_REPLICA = 'replica'  # an alias of DATABASES
+
+Only the reads made inside a replica_reads block, opened by the views with
+ReplicaReadMixin, go to the replica: the ones of the detail of the booking
+types, of the page and the month fragments of the slot time selection and of
+the first free slot times, the values they compute when missing from the
+availability cache included (but for the booking types just written, see
+nowait.cache). Everything else, the JSON availability, the bookings, the
+writes and the admin included, uses the default database. After a booking
+the session of the user is pinned to the default database for
+NOWAIT_READ_REPLICA_PIN_SECONDS seconds, so the user never sees the booked
+slot time still free because of the replication lag.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS
+
+from mezzanine.conf import settings
+
+PIN_SESSION_KEY = 'nowait_read_replica_pinned_until'
+
+_state = threading.local()
+
+
+def get_replica():
+    """
+    Return the alias of the read replica or None if it's not configured.
+    """
+    return getattr(settings, 'NOWAIT_READ_REPLICA', None) or None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Context manager that sends the reads of the nowait models of the block
+    to the read replica, or to the default database if enabled is False.
+    """
+    previous = getattr(_state, 'replica', False)
+    _state.replica = enabled
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def is_replica_reads():
+    """
+    Return True inside a replica_reads block that sends the reads to the
+    read replica.
+    """
+    return getattr(_state, 'replica', False)
+
+
+def primary_reads():
+    """
+    Context manager that sends the reads of the block to the default
+    database even inside a replica_reads block.
+    """
+    return replica_reads(enabled=False)
+
+
+def pin_primary(request):
+    """
+    Pin the session of request, if any, to the default database for
+    NOWAIT_READ_REPLICA_PIN_SECONDS seconds, after a write of the user.
+    """
+    session = getattr(request, 'session', None)
+    if session is not None:
+        session[PIN_SESSION_KEY] = (
+            time.time() + settings.NOWAIT_READ_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    """
+    Return True if the session of request is pinned to the default database.
+    """
+    session = getattr(request, 'session', None)
+    return bool(session) and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+class ReplicaReadMixin(object):
+    """
+    Mixin of the read-only views that makes their reads of the nowait models
+    on the read replica, unless the session is pinned to the default
+    database.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(enabled=not is_pinned(request)):
+            return super(ReplicaReadMixin, self).dispatch(request, *args,
+                                                          **kwargs)
+
+
+class ReplicaRouter(object):
+    """
+    Router of the reads of the nowait models made inside replica_reads
+    blocks to the read replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = get_replica()
+        if (replica and getattr(_state, 'replica', False) and
+                model._meta.app_label == 'nowait'):
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same rows of the default database
+        databases = (DEFAULT_DB_ALIAS, get_replica())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if db == get_replica():
+            return False
+        return None
@@ -0,0 +1,20 @@
+/* Lazy loading of the months of the slot time selection page. */
+(function ($) {
+    'use strict';
+
+    $(document).on('show.bs.tab', '.nowait-slottime-months a[data-url]',
+                   function () {
+        var link = $(this),
+            pane = $(link.attr('href'));
+        if (pane.data('loaded')) {
+            return;
+        }
+        pane.data('loaded', true);
+        pane.load(link.attr('data-url'), function (response, status) {
+            if (status === 'error') {
+                // retry when the tab is opened again
+                pane.data('loaded', false);
+            }
+        });
+    });
+}(jQuery));
@@ -0,0 +1,41 @@
+/* Polling of progress of slot times generations queued from changelist. */
+(function () {
+    'use strict';
+
+    var POLLING_INTERVAL = 2000,
+        ACTIVE_STATUSES = ['queued', 'running'];
+
+    function isActive(element) {
+        return ACTIVE_STATUSES.indexOf(element.getAttribute('data-status')) >= 0;
+    }
+
+    function refresh(element) {
+        var request = new XMLHttpRequest();
+        request.open('GET', element.getAttribute('data-url'), true);
+        request.onload = function () {
+            if (request.status !== 200) {
+                return;
+            }
+            var data = JSON.parse(request.responseText);
+            element.setAttribute('data-status', data.status);
+            element.setAttribute('title', data.errors);
+            element.textContent = data.done + '/' + data.total + ' (' +
+                data.status_display + ')';
+            if (isActive(element)) {
+                window.setTimeout(function () { refresh(element); },
+                                  POLLING_INTERVAL);
+            }
+        };
+        request.send();
+    }
+
+    window.addEventListener('load', function () {
+        var elements = document.querySelectorAll('.nowait-generation-progress'),
+            i;
+        for (i = 0; i < elements.length; i += 1) {
+            if (isActive(elements[i])) {
+                refresh(elements[i]);
+            }
+        }
+    });
+}());
@@ -1,9 +1,52 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import logging
+import time
+
 from celery import shared_task
 
 
 @shared_task
 def create_operators_event():
     pass
+
+
+@shared_task
+def generate_booking_type_slot_times(generation_pks, regenerate=False):
+    """
+    Run in sequence the generations of one booking type.
+
+    :return: list with a summary dict (generation, booking_type, status,
+             count, seconds) for every generation
+    """
+    from .models import SlotTimesGeneration
+    summaries = []
+    for generation in SlotTimesGeneration.objects.filter(
+            pk__in=generation_pks).order_by('pk'):
+        started = time.time()
+        count = generation.generate(regenerate=regenerate)
+        summaries.append({'generation': generation.pk,
+                          'booking_type': generation.booking_type_id,
+                          'status': generation.status, 'count': count,
+                          'seconds': round(time.time() - started, 3)})
+    return summaries
+
+
+@shared_task
+def summarize_slot_times_generations(results):
+    """
+    Collect the summaries of generate_booking_type_slot_times subtasks,
+    store them on their generations and log them.
+    """
+    from .models import SlotTimesGeneration
+    summaries = [summary for summaries in results for summary in summaries]
+    SlotTimesGeneration.objects.store_summaries(summaries)
+    logger = logging.getLogger('nowait')
+    for summary in summaries:
+        logger.info('Slot times generation %(generation)s: %(status)s,'
+                    ' %(count)s slot times in %(seconds)ss', summary)
+    logger.info('%s slot times generations completed in %ss',
+                len(summaries),
+                sum(summary['seconds'] for summary in summaries))
+    return summaries
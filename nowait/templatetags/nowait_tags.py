@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from django import template
+from django.core.urlresolvers import reverse
+from django.utils.dateformat import format as format_date
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.timezone import localtime
+from django.utils.translation import ugettext
+
+from ..core import datetime_to_timestamp
+
+register = template.Library()
+
+# a value of the pk and timestamp URL parameters that never occurs elsewhere
+# in the URL, replaced with the actual values
+URL_MARKER = '9' * 15
+
+SLOTTIME_BUTTON = (
+    '<div class="col-sm-6 col-md-4">'
+    '<a href="{url}" id="btn_book_slottime_{id}"'
+    ' class="btn btn-primary thumbnail" title="{title}">{label}</a>'
+    '</div>\n')
+
+
+def _reverse_prefix(viewname, **kwargs):
+    """
+    Return the (prefix, suffix) parts of the URL of viewname around the
+    value of the URL parameter set to URL_MARKER in kwargs.
+    """
+    prefix, suffix = reverse(viewname, kwargs=kwargs).split(URL_MARKER)
+    return prefix, suffix
+
+
+@register.simple_tag
+def slottime_buttons(slottimes):
+    """
+    Render the booking buttons of slottimes of slottime_select.html in one
+    pass.
+
+    The URLs are built from prefixes reversed once, the translated label
+    is formatted once for every slot time and the label of every day is
+    computed once: the cost of the template loop with a {% url %} and two
+    {% blocktrans %} for every slot time was linear with a large factor.
+    """
+    label_format = ugettext('%(day)s from %(from)s to %(to)s')
+    title_prefix = escape(ugettext('Select slot time')) + '&nbsp;'
+    urls = {}
+    days = {}
+    buttons = []
+    for slottime in slottimes:
+        start, end = localtime(slottime.start), localtime(slottime.end)
+        if slottime.pk:
+            url_key, value, slottime_id = None, slottime.pk, slottime.pk
+        else:
+            value = datetime_to_timestamp(slottime.start)
+            url_key, slottime_id = slottime.booking_type.slug, 'v%s' % value
+        if url_key not in urls:
+            urls[url_key] = (
+                _reverse_prefix('nowait:booking_create',
+                                slottime_pk=URL_MARKER)
+                if url_key is None else
+                _reverse_prefix('nowait:booking_create_virtual',
+                                slug=url_key, timestamp=URL_MARKER))
+        prefix, suffix = urls[url_key]
+        day = start.date()
+        if day not in days:
+            days[day] = escape(format_date(start, 'l j'))
+        label = label_format % {'day': days[day],
+                                'from': '{0:%H:%M}'.format(start),
+                                'to': '{0:%H:%M}'.format(end)}
+        buttons.append(SLOTTIME_BUTTON.format(
+            url='{0}{1}{2}'.format(prefix, value, suffix),
+            id=slottime_id, title=title_prefix + label, label=label))
+    return mark_safe(''.join(buttons))
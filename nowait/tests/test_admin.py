@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import json
+
 from django.contrib.admin import AdminSite
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
 from django.utils.timezone import timedelta, now
 try:
     from unittest.mock import patch, Mock
@@ -13,10 +15,11 @@ except ImportError:
 from django.contrib import messages
 from django.core.exceptions import ImproperlyConfigured
 
-from ..admin import (BookingTypeAdmin, CalendarAdmin, SlotTimeAdmin,
-                     SlotTimesGenerationAdmin)
-from ..models import (BookingType, SlotTime, Calendar, SlotTimesGeneration)
-from .factories import BookingTypeF
+from ..admin import (BookingTypeAdmin, CalendarAdmin, ClosureAdmin,
+                     SlotTimeAdmin, SlotTimesGenerationAdmin)
+from ..models import (BookingType, SlotTime, Calendar, Closure,
+                      SlotTimesGeneration)
+from .factories import BookingTypeF, BookingType30F, BookingType45F
 
 
 class CalendarAdminTest(TestCase):
@@ -191,6 +194,30 @@ class BookingTypeAdminTest(TestCase):
         self.assertEqual(fieldset[1][0], 'Publication data')
 
 
+class ClosureAdminTest(TestCase):
+
+    def test_save_model_prune_slottimes_and_report_taken(self):
+        booking_type = BookingType30F()
+        start = now() + timedelta(days=1)
+        for status in (SlotTime.STATUS.free, SlotTime.STATUS.taken):
+            SlotTime.objects.create(booking_type=booking_type, start=start,
+                                    end=start + timedelta(minutes=30),
+                                    status=status)
+            start += timedelta(minutes=30)
+        closure = Closure(booking_type=booking_type,
+                          start_date=start.date() - timedelta(days=1),
+                          end_date=start.date() + timedelta(days=1))
+        closureadmin = ClosureAdmin(Closure, AdminSite)
+        closureadmin.message_user = Mock()
+        request = Mock()
+        closureadmin.save_model(request, closure, Mock(), False)
+        self.assertEqual(SlotTime.objects.get().status,
+                         SlotTime.STATUS.taken)
+        self.assertEqual(closureadmin.message_user.call_count, 2)
+        self.assertEqual(closureadmin.message_user.call_args[1],
+                         {'level': messages.WARNING})
+
+
 class SlotTimesGenerationAdminTest(TestCase):
 
     def test_slottimes_lt_callble_without_related_slottime(self):
@@ -210,3 +237,58 @@ class SlotTimesGenerationAdminTest(TestCase):
             '<a href="{url}?generation={stg.pk}">{count}</a>'.format(
                 url=reverse('admin:nowait_slottime_changelist'),
                 stg=slottimegeneration, count=slottimes))
+
+    @patch('celery.chord')
+    def test_create_slottimes_action_queue_generations(self, mock_chord):
+        today = now().date()
+        booking_type_30, booking_type_45 = BookingType30F(), BookingType45F()
+        generations = [SlotTimesGeneration.objects.create(
+            booking_type=booking_type, start_date=today,
+            end_date=today + timedelta(days=10))
+            for booking_type in [booking_type_30, booking_type_30,
+                                 booking_type_45]]
+        stgadmin = SlotTimesGenerationAdmin(SlotTimesGeneration, AdminSite)
+        stgadmin.message_user = Mock()
+        stgadmin.create_slottimes(Mock(), SlotTimesGeneration.objects.all())
+        # one subtask for every booking type
+        subtasks = sorted(list(mock_chord.call_args[0][0]),
+                          key=lambda subtask: subtask.args[0])
+        self.assertEqual([subtask.args[0] for subtask in subtasks],
+                         [[generations[0].pk, generations[1].pk],
+                          [generations[2].pk]])
+        self.assertEqual([subtask.kwargs for subtask in subtasks],
+                         [{'regenerate': False}, {'regenerate': False}])
+        self.assertEqual(
+            SlotTimesGeneration.objects.filter(
+                status=SlotTimesGeneration.STATUS.queued).count(), 3)
+
+    def test_preview_slottimes_action(self):
+        today = now().date()
+        booking_type = BookingType30F()
+        booking_type.dailyslottimepattern_set.create(
+            day=today.weekday(), start_time='9:00', end_time='11:00')
+        generation = SlotTimesGeneration.objects.create(
+            booking_type=booking_type, start_date=today, end_date=today)
+        stgadmin = SlotTimesGenerationAdmin(SlotTimesGeneration, AdminSite())
+        response = stgadmin.preview_slottimes(
+            RequestFactory().get('/fake'), SlotTimesGeneration.objects.all())
+        self.assertEqual(
+            response.context_data['previews'],
+            [(generation, {'total': 4, 'created': 4, 'duplicates': 0,
+                           'overlaps': 0}, None)])
+        self.assertEqual(SlotTime.objects.count(), 0)
+
+    def test_progress_view(self):
+        today = now().date()
+        generation = SlotTimesGeneration.objects.create(
+            booking_type=BookingType30F(), start_date=today, end_date=today,
+            status=SlotTimesGeneration.STATUS.running, slottimes_done=10,
+            slottimes_total=40)
+        stgadmin = SlotTimesGenerationAdmin(SlotTimesGeneration, AdminSite)
+        response = stgadmin.progress_view(RequestFactory().get('/fake'),
+                                          generation.pk)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['status'], SlotTimesGeneration.STATUS.running)
+        self.assertEqual(data['done'], 10)
+        self.assertEqual(data['total'], 40)
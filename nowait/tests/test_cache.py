@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import datetime
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.timezone import make_aware, get_current_timezone
+
+from ..cache import (atomic_invalidation, batch_invalidation,
+                     get_availability, get_bitmap, get_combined_availability,
+                     get_version,
+                     invalidate_availability, invalidate_bitmaps,
+                     run_commit_invalidations, update_bitmap)
+from ..models import SlotTime
+from ..routers import ReplicaRouter, replica_reads
+
+
+class AvailabilityCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_availability_compute_once(self):
+        compute = Mock(return_value=[1, 2])
+        self.assertEqual(get_availability(1, 'key', compute), [1, 2])
+        self.assertEqual(get_availability(1, 'key', compute), [1, 2])
+        self.assertEqual(compute.call_count, 1)
+
+    def test_invalidate_availability(self):
+        compute = Mock(return_value=[])
+        get_availability(1, 'key', compute)
+        get_availability(2, 'key', compute)
+        invalidate_availability(1)
+        get_availability(1, 'key', compute)
+        get_availability(2, 'key', compute)
+        self.assertEqual(compute.call_count, 3)
+
+    def test_batch_invalidation_increment_version_once(self):
+        version = get_version(1)
+        with batch_invalidation():
+            for i in range(0, 3):
+                invalidate_availability(1)
+            self.assertEqual(get_version(1), version)
+        self.assertEqual(get_version(1), version + 1)
+
+    def test_request_finished_increment_version_again(self):
+        version = get_version(1)
+        # inside the transaction of the test
+        invalidate_availability(1)
+        self.assertEqual(get_version(1), version + 1)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(get_version(1), version + 2)
+
+
+@override_settings(NOWAIT_READ_REPLICA='replica')
+class ReplicaComputeTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def read_database(self):
+        return ReplicaRouter().db_for_read(SlotTime)
+
+    def test_compute_on_replica(self):
+        with replica_reads():
+            self.assertEqual(get_availability(1, 'key', self.read_database),
+                             'replica')
+            self.assertEqual(get_bitmap(1, datetime.date(2013, 5, 1),
+                                        self.read_database), 'replica')
+
+    def test_compute_on_default_after_write(self):
+        invalidate_availability(1)
+        with replica_reads():
+            self.assertIsNone(get_availability(1, 'key', self.read_database))
+            self.assertEqual(get_availability(2, 'key', self.read_database),
+                             'replica')
+            self.assertIsNone(get_combined_availability(
+                [1, 2], 'key', self.read_database, 60))
+
+
+class CommitInvalidationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidate_again_after_commit(self):
+        compute = Mock(return_value=[])
+        with atomic_invalidation():
+            invalidate_availability(1)
+            # a concurrent request reading the rows before the commit
+            get_availability(1, 'key', compute)
+        get_availability(1, 'key', compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_invalidate_once_outside_transactions(self):
+        version = get_version(1)
+        invalidate_availability(1)
+        self.assertEqual(get_version(1), version + 1)
+
+
+class AvailabilityBitmapCacheTest(TestCase):
+
+    def setUp(self):
+        # discard the changes of the bitmaps of the previous tests, whose
+        # transactions are never committed
+        run_commit_invalidations(committed=False)
+        cache.clear()
+        self.month = datetime.date(2013, 5, 1)
+        self.compute = Mock(return_value=(30, {6: 1 << 18}))
+        get_bitmap(1, self.month, self.compute)
+
+    def get_bitmaps(self):
+        return get_bitmap(1, self.month, self.compute)[1]
+
+    def test_update_bitmap(self):
+        update_bitmap(1, make_aware(datetime.datetime(2013, 5, 6, 9, 30),
+                                    get_current_timezone()), free=True)
+        update_bitmap(1, make_aware(datetime.datetime(2013, 5, 6, 9),
+                                    get_current_timezone()), free=False)
+        run_commit_invalidations()
+        self.assertEqual(self.get_bitmaps(), {6: 1 << 19})
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_update_bitmap_inside_batch_invalidate_bitmaps(self):
+        with batch_invalidation():
+            update_bitmap(1, make_aware(datetime.datetime(2013, 5, 6, 9, 30),
+                                        get_current_timezone()), free=True)
+            self.get_bitmaps()
+            self.assertEqual(self.compute.call_count, 1)
+        self.assertEqual(self.get_bitmaps(), {6: 1 << 18})
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_invalidate_bitmaps(self):
+        invalidate_bitmaps(2)
+        self.get_bitmaps()
+        invalidate_bitmaps(1)
+        self.get_bitmaps()
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_update_bitmap_after_commit(self):
+        # inside the transaction of the test
+        update_bitmap(1, make_aware(datetime.datetime(2013, 5, 6, 9, 30),
+                                    get_current_timezone()), free=True)
+        self.assertEqual(self.get_bitmaps(), {6: 1 << 18})
+        run_commit_invalidations()
+        self.assertEqual(self.get_bitmaps(), {6: 0b11 << 18})
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_update_bitmap_rolled_back_invalidate_bitmaps(self):
+        with self.assertRaises(ValueError):
+            with atomic_invalidation():
+                update_bitmap(1, make_aware(
+                    datetime.datetime(2013, 5, 6, 9, 30),
+                    get_current_timezone()), free=True)
+                raise ValueError
+        run_commit_invalidations()
+        self.assertEqual(self.get_bitmaps(), {6: 1 << 18})
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_update_bitmap_locked_invalidate_bitmaps(self):
+        cache.set('nowait:bitmap:1:2013-05:lock', 1)
+        update_bitmap(1, make_aware(datetime.datetime(2013, 5, 6, 9, 30),
+                                    get_current_timezone()), free=True)
+        run_commit_invalidations()
+        self.assertEqual(self.get_bitmaps(), {6: 1 << 18})
+        self.assertEqual(self.compute.call_count, 2)
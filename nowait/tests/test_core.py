@@ -1,8 +1,17 @@
 # -*- coding: iso-8859-1 -*-
 from __future__ import unicode_literals, absolute_import
-from datetime import date, timedelta
+from array import array
+from datetime import date, datetime, time, timedelta
+
+import pytz
 from django.test import TestCase
-from ..core import get_range_days, get_week_map_by_weekday
+from django.utils.timezone import utc
+from ..core import (TIMESTAMP_TYPECODE, IntervalIndex, datetime_to_timestamp,
+                    exclude_overlapping, expand_slot_times, get_grid_step,
+                    get_local_timestamps, get_range_days, get_slot_position,
+                    get_utc_offset_table, get_week_map_by_weekday,
+                    iter_bitmap_positions, iter_range_days, merge_intervals,
+                    timestamp_to_datetime)
 
 
 class GetRangeDaysTest(TestCase):
@@ -18,9 +27,6 @@ class GetRangeDaysTest(TestCase):
         self.assertRaises(ValueError, get_range_days,
                           date.today() + timedelta(days=2),
                           date.today())
-        self.assertRaises(ValueError, get_range_days,
-                          date.today(),
-                          date.today() + timedelta(days=500))
 
     def test_create_slot_times_call_with_same_day_same_month(self):
         """
@@ -56,6 +62,33 @@ class GetRangeDaysTest(TestCase):
              for day in range(self.start_date.day,
                               self.start_date.day + range_days + 1)])
 
+    def test_get_range_days_across_years(self):
+        days = get_range_days(date(2013, 11, 30), date(2015, 3, 1))
+        self.assertEqual(len(days), 457)
+        self.assertEqual(days[0], date(2013, 11, 30))
+        self.assertEqual(days[-1], date(2015, 3, 1))
+        self.assertEqual(days[31:34], [date(2013, 12, 31), date(2014, 1, 1),
+                                       date(2014, 1, 2)])
+
+
+class IterRangeDaysTest(TestCase):
+
+    def test_wrong_parameters_raise_on_call(self):
+        self.assertRaises(TypeError, iter_range_days, 'a', 'b')
+        self.assertRaises(ValueError, iter_range_days, date(2013, 5, 6),
+                          date(2013, 5, 5))
+
+    def test_is_a_generator(self):
+        days = iter_range_days(date(2013, 12, 30), date(2014, 1, 2))
+        self.assertEqual(next(days), date(2013, 12, 30))
+        self.assertEqual(list(days), [date(2013, 12, 31), date(2014, 1, 1),
+                                      date(2014, 1, 2)])
+
+    def test_with_datetime_parameters(self):
+        start = datetime(2013, 5, 6, 10, 0)
+        self.assertEqual(list(iter_range_days(start, start)),
+                         [date(2013, 5, 6)])
+
 
 class GetWeekMapByWeekdayTest(TestCase):
 
@@ -69,3 +102,148 @@ class GetWeekMapByWeekdayTest(TestCase):
     def test_get_week_map_by_weekday_call(self):
         get_week_map_by_weekday(get_range_days(self.start_date,
                                                self.end_date))
+
+
+class ExpandSlotTimesTest(TestCase):
+
+    def setUp(self):
+        # 6 may of 2013 is a monday
+        self.start_date = date(2013, 5, 6)
+
+    def test_timestamp_conversions(self):
+        value = datetime(2013, 5, 6, 9, 30, tzinfo=utc)
+        self.assertEqual(
+            timestamp_to_datetime(datetime_to_timestamp(value), utc), value)
+
+    def test_expand_one_pattern(self):
+        starts, ends = expand_slot_times(
+            [(0, time(9), time(11))], 30, self.start_date,
+            self.start_date + timedelta(days=7), utc)
+        expected = [datetime(2013, 5, day, hour, minute, tzinfo=utc)
+                    for day in (6, 13) for hour in (9, 10)
+                    for minute in (0, 30)]
+        self.assertEqual([timestamp_to_datetime(start, utc)
+                          for start in starts], expected)
+        self.assertEqual([end - start for start, end in zip(starts, ends)],
+                         [30 * 60] * len(expected))
+
+    def test_expand_ignores_incomplete_slot_time(self):
+        starts, ends = expand_slot_times(
+            [(0, time(9), time(10, 40))], 45, self.start_date,
+            self.start_date, utc)
+        self.assertEqual(len(starts), 2)
+
+    def test_expand_more_patterns_are_ordered_by_start(self):
+        starts, ends = expand_slot_times(
+            [(0, time(14), time(15)), (0, time(9), time(10)),
+             (1, time(9), time(10))], 60, self.start_date,
+            self.start_date + timedelta(days=1), utc)
+        self.assertEqual(
+            [timestamp_to_datetime(start, utc) for start in starts],
+            [datetime(2013, 5, 6, 9, tzinfo=utc),
+             datetime(2013, 5, 6, 14, tzinfo=utc),
+             datetime(2013, 5, 7, 9, tzinfo=utc)])
+
+    def _expand_on_transition_day(self, day):
+        tz = pytz.timezone('Europe/Rome')
+        starts, ends = expand_slot_times([(6, time(1), time(4))], 30, day,
+                                         day, tz)
+        return [timestamp_to_datetime(start, tz).strftime('%H:%M%z')
+                for start in starts]
+
+    def test_expand_skip_spring_forward_gap(self):
+        # 30 march 2014 clocks go from 2:00 to 3:00 in Italy
+        self.assertEqual(self._expand_on_transition_day(date(2014, 3, 30)),
+                         ['01:00+0100', '01:30+0100', '03:00+0200',
+                          '03:30+0200'])
+
+    def test_expand_take_first_occurrence_in_autumn_overlap(self):
+        # 26 october 2014 clocks go from 3:00 back to 2:00 in Italy
+        self.assertEqual(self._expand_on_transition_day(date(2014, 10, 26)),
+                         ['01:00+0200', '01:30+0200', '02:00+0200',
+                          '02:30+0200', '03:00+0100', '03:30+0100'])
+
+    def test_get_local_timestamps(self):
+        tz = pytz.timezone('Europe/Rome')
+        offsets = [3600 * 2 + 1800, 3600 * 9]
+        for day, expected in [
+                (date(2014, 3, 29), ['02:30+0100', '09:00+0100']),
+                (date(2014, 3, 30), ['09:00+0200']),
+                (date(2014, 10, 26), ['02:30+0200', '09:00+0100'])]:
+            self.assertEqual(
+                [timestamp_to_datetime(timestamp, tz).strftime('%H:%M%z')
+                 for timestamp in get_local_timestamps(tz, day, offsets)],
+                expected)
+
+    def test_utc_offset_table(self):
+        table = get_utc_offset_table(pytz.timezone('Europe/Rome'),
+                                     date(2014, 3, 29), date(2014, 3, 31))
+        self.assertEqual(table, {date(2014, 3, 29): 3600,
+                                 date(2014, 3, 30): None,
+                                 date(2014, 3, 31): 7200})
+
+
+class MergeIntervalsTest(TestCase):
+
+    def test_merge_overlapping_and_adjacent_intervals(self):
+        self.assertEqual(
+            merge_intervals([(30, 40), (0, 10), (5, 15), (15, 20)]),
+            [(0, 20), (30, 40)])
+
+    def test_exclude_overlapping(self):
+        starts, ends = exclude_overlapping(
+            (array(TIMESTAMP_TYPECODE, [0, 10, 20]),
+             array(TIMESTAMP_TYPECODE, [10, 20, 30])),
+            IntervalIndex([(15, 18)]))
+        self.assertEqual(list(starts), [0, 20])
+        self.assertEqual(list(ends), [10, 30])
+
+
+class IntervalIndexTest(TestCase):
+
+    def setUp(self):
+        self.index = IntervalIndex([(30, 40), (0, 10), (10, 20)])
+
+    def test_intervals_are_sorted(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.starts, [0, 10, 30])
+        self.assertEqual(self.index.ends, [10, 20, 40])
+
+    def test_overlaps(self):
+        for start, end in [(5, 15), (15, 25), (25, 35), (35, 45), (-5, 5),
+                           (0, 40), (31, 32)]:
+            self.assertTrue(self.index.overlaps(start, end), (start, end))
+        for start, end in [(20, 30), (-10, 0), (40, 50), (21, 29)]:
+            self.assertFalse(self.index.overlaps(start, end), (start, end))
+
+    def test_add(self):
+        self.assertTrue(self.index.add(20, 30))
+        self.assertFalse(self.index.add(25, 35))
+        self.assertTrue(self.index.add(40, 50))
+        self.assertEqual(self.index.starts, [0, 10, 20, 30, 40])
+        self.assertEqual(self.index.ends, [10, 20, 30, 40, 50])
+
+
+class BitmapGridTest(TestCase):
+
+    def test_get_grid_step(self):
+        self.assertEqual(get_grid_step(30, [time(9), time(14, 30)]), 30)
+        self.assertEqual(get_grid_step(30, [time(9), time(9, 15)]), 15)
+        self.assertEqual(get_grid_step(45, []), 45)
+
+    def test_slot_positions_are_unique(self):
+        # slot times of 45 minutes every 45 minutes from 9:15
+        step = get_grid_step(45, [time(9, 15)])
+        starts = [datetime(2013, 5, 6, 9, 15) + timedelta(minutes=45 * i)
+                  for i in range(0, 10)]
+        positions = [get_slot_position(step, start) for start in starts]
+        self.assertEqual(len(set(positions)), len(starts))
+        self.assertEqual(
+            [time(minute // 60, minute % 60) for minute in
+             (position * step for position in positions)],
+            [start.time() for start in starts])
+
+    def test_iter_bitmap_positions(self):
+        self.assertEqual(list(iter_bitmap_positions(0b101001 << 40)),
+                         [40, 43, 45])
+        self.assertEqual(list(iter_bitmap_positions(0)), [])
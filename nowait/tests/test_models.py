@@ -9,19 +9,28 @@ try:
 except ImportError:
     from mock import Mock, patch, ANY, call
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models.query import QuerySet
 from django.test import TestCase, TransactionTestCase, RequestFactory
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.timezone import (timedelta, make_aware, get_current_timezone,
-                                   now)
+                                   now, utc)
 
 from mezzanine.conf import settings
 from mezzanine.pages.models import Link, RichTextPage
 
-from ..models import (DAYS, Calendar, Email, BookingType, DailySlotTimePattern,
-                      SlotTimesGeneration, SlotTime, Booking)
+from ..cache import run_commit_invalidations
+from ..models import (DAYS, Calendar, Closure, Email, BookingType,
+                      DailyAvailability, DailySlotTimePattern,
+                      SlotTimesGeneration, SlotTime, SlotTimeTaken, Booking)
 from .factories import (BookingType30F, BookingType45F, BookingTypeF,
                         UserF, AdminF)
+from ..core import datetime_to_timestamp
+from ..tasks import (generate_booking_type_slot_times,
+                     summarize_slot_times_generations)
 from ..utils import get_or_create_root_app_page
 
 
@@ -111,6 +120,70 @@ class BookingTypeModelTest(TestCase):
             emails,
             [email for email in Email.objects.values_list('email', flat=True)])
 
+    def _create_virtual_booking_type(self):
+        booking_type = BookingType30F(virtual_slottimes=True)
+        tomorrow = now().astimezone(get_current_timezone()).date() + timedelta(
+            days=1)
+        DailySlotTimePattern.objects.create(
+            booking_type=booking_type, day=tomorrow.weekday(),
+            start_time=datetime.time(9), end_time=datetime.time(11))
+        start = make_aware(datetime.datetime.combine(
+            tomorrow, datetime.time(0)), get_current_timezone())
+        return booking_type, start
+
+    def test_get_virtual_slottimes_from_patterns(self):
+        booking_type, start = self._create_virtual_booking_type()
+        slottimes = booking_type.get_virtual_slottimes(
+            start, start + timedelta(days=1))
+        self.assertEqual(len(slottimes), 4)
+        self.assertTrue(all(slottime.pk is None for slottime in slottimes))
+        self.assertEqual(slottimes[0].start, start + timedelta(hours=9))
+        self.assertEqual(SlotTime.objects.count(), 0)
+
+    def test_get_virtual_slottimes_skip_stored_slottimes(self):
+        booking_type, start = self._create_virtual_booking_type()
+        SlotTime.objects.create(
+            booking_type=booking_type, status=SlotTime.STATUS.taken,
+            start=start + timedelta(hours=9, minutes=15),
+            end=start + timedelta(hours=9, minutes=45))
+        slottimes = booking_type.get_virtual_slottimes(
+            start, start + timedelta(days=1))
+        self.assertEqual([slottime.start for slottime in slottimes],
+                         [start + timedelta(hours=10),
+                          start + timedelta(hours=10, minutes=30)])
+
+    def test_get_virtual_slottime(self):
+        booking_type, start = self._create_virtual_booking_type()
+        slot_start = start + timedelta(hours=9, minutes=30)
+        slottime = booking_type.get_virtual_slottime(
+            datetime_to_timestamp(slot_start))
+        self.assertEqual(slottime.start, slot_start)
+        self.assertIsNone(booking_type.get_virtual_slottime(
+            datetime_to_timestamp(slot_start + timedelta(minutes=10))))
+
+    def test_get_virtual_slottime_out_of_range(self):
+        booking_type, start = self._create_virtual_booking_type()
+        for timestamp in (10 ** 20, 253402300000):
+            self.assertIsNone(booking_type.get_virtual_slottime(timestamp))
+
+    def test_get_page_for_booking_of_virtual_slottimes(self):
+        booking_type, start = self._create_virtual_booking_type()
+        end = start + timedelta(days=45)
+        pages, cursor = [], None
+        while True:
+            page, cursor = SlotTime.free.get_page_for_booking(
+                booking_type, start, end, after=cursor, limit=3)
+            pages.append(page)
+            if cursor is None:
+                break
+        self.assertTrue(all(len(full) == 3 for full in pages[:-1]))
+        # the windows of VIRTUAL_PAGE_DAYS days neither lose nor repeat
+        # slot times
+        self.assertEqual(
+            [slottime.start for each in pages for slottime in each],
+            [slottime.start for slottime in
+             booking_type.get_virtual_slottimes(start, end)])
+
 
 class DailySlotTimePatternModelTest(TestCase):
 
@@ -128,6 +201,261 @@ class DailySlotTimePatternModelTest(TestCase):
                                obj.start_time, obj.end_time))
 
 
+class ClosureModelTest(TestCase):
+
+    def setUp(self):
+        self.booking_type = BookingType30F()
+        self.user = UserF()
+        # 6 may of 2013 is a monday
+        self.day = datetime.date(2013, 5, 6)
+        self.booking_type.dailyslottimepattern_set.create(
+            day=self.day.weekday(), start_time='9:00', end_time='11:00')
+        self.generation = SlotTimesGeneration.objects.create(
+            booking_type=self.booking_type, start_date=self.day,
+            end_date=self.day + timedelta(days=7), user=self.user)
+
+    def test_clean_require_calendar_or_booking_type(self):
+        closure = Closure(start_date=self.day, end_date=self.day)
+        self.assertRaises(ValidationError, closure.clean)
+        closure.booking_type = self.booking_type
+        closure.calendar = self.booking_type.calendar
+        self.assertRaises(ValidationError, closure.clean)
+        closure.calendar = None
+        closure.clean()
+
+    def test_clean_require_both_times(self):
+        closure = Closure(booking_type=self.booking_type, start_date=self.day,
+                          end_date=self.day, start_time=datetime.time(9))
+        self.assertRaises(ValidationError, closure.clean)
+
+    def test_generation_skip_closed_days(self):
+        Closure.objects.create(calendar=self.booking_type.calendar,
+                               start_date=self.day, end_date=self.day)
+        result, = self.generation.create_slot_times(bulk=True)
+        self.assertEqual(result, 4)
+        self.assertFalse(self.booking_type.slottime_set.filter(
+            start__lt=make_aware(datetime.datetime(2013, 5, 7),
+                                 get_current_timezone())).exists())
+
+    def test_generation_skip_closed_windows(self):
+        Closure.objects.create(booking_type=self.booking_type,
+                               start_date=self.day,
+                               end_date=self.day + timedelta(days=7),
+                               start_time=datetime.time(10, 15),
+                               end_time=datetime.time(12))
+        result, = self.generation.create_slot_times(bulk=True)
+        # only 9:00 and 9:30 are open, the 10:00 slot time ends after 10:15
+        self.assertEqual(result, 4)
+
+    def test_prune_slottimes(self):
+        self.generation.create_slot_times(bulk=True)
+        taken = self.booking_type.slottime_set.order_by('start')[0]
+        taken.status = SlotTime.STATUS.taken
+        taken.save()
+        closure = Closure.objects.create(booking_type=self.booking_type,
+                                         start_date=self.day,
+                                         end_date=self.day)
+        deleted, hit = closure.prune_slottimes()
+        self.assertEqual(deleted, 3)
+        self.assertEqual(hit, [taken])
+        self.assertEqual(self.booking_type.slottime_set.count(), 5)
+
+    def test_prune_slottimes_update_counters_once_for_every_day(self):
+        self.generation.create_slot_times(bulk=True)
+        closure = Closure.objects.create(booking_type=self.booking_type,
+                                         start_date=self.day,
+                                         end_date=self.day + timedelta(days=7))
+        # the 8 slot times are deleted together and the counters of their
+        # 2 days updated with one query each
+        with self.assertNumQueries(9):
+            deleted, hit = closure.prune_slottimes()
+        self.assertEqual(deleted, 8)
+        self.assertEqual(list(DailyAvailability.objects.for_booking_type(
+            self.booking_type, self.day).values_list('free', flat=True)),
+            [0, 0])
+
+
+class DailyAvailabilityModelTest(TestCase):
+
+    def setUp(self):
+        self.booking_type = BookingType30F()
+        # 6 may of 2013 is a monday
+        self.day = datetime.date(2013, 5, 6)
+        self.booking_type.dailyslottimepattern_set.create(
+            day=self.day.weekday(), start_time='9:00', end_time='11:00')
+        SlotTimesGeneration.objects.create(
+            booking_type=self.booking_type, start_date=self.day,
+            end_date=self.day + timedelta(days=7)).create_slot_times(
+            bulk=True)
+
+    def get_counters(self):
+        return list(DailyAvailability.objects.filter(
+            booking_type=self.booking_type).values_list(
+            'date', 'free', 'taken'))
+
+    def test_bulk_generation_update_counters(self):
+        self.assertEqual(self.get_counters(),
+                         [(self.day, 4, 0),
+                          (self.day + timedelta(days=7), 4, 0)])
+
+    def test_save_and_take_slottime_update_counters(self):
+        request = RequestFactory().get('/fake')
+        request.user = UserF()
+        Booking().save_and_take_slottime(
+            self.booking_type.slottime_set.order_by('start')[0], request)
+        self.assertEqual(self.get_counters()[0], (self.day, 3, 1))
+
+    def test_delete_update_counters(self):
+        SlotTime.objects.filter(start__lt=make_aware(
+            datetime.datetime(2013, 5, 7), get_current_timezone())).delete()
+        self.assertEqual(self.get_counters(),
+                         [(self.day, 0, 0),
+                          (self.day + timedelta(days=7), 4, 0)])
+
+    def test_add_update_counters_created_meanwhile(self):
+        day = self.day + timedelta(days=1)
+        DailyAvailability.objects.create(booking_type=self.booking_type,
+                                         date=day, free=2)
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # the first UPDATE runs before the concurrent INSERT is committed
+            racing_update.calls += 1
+            return update(queryset, **kwargs) if racing_update.calls > 1 else 0
+
+        racing_update.calls = 0
+        with patch.object(QuerySet, 'update', racing_update):
+            DailyAvailability.objects.add(
+                self.booking_type.pk, [make_aware(datetime.datetime.combine(
+                    day, datetime.time(9)), get_current_timezone())], free=1)
+        self.assertIn((day, 3, 0), self.get_counters())
+
+    def test_get_next_free_day(self):
+        self.assertEqual(self.booking_type.get_next_free_day(self.day),
+                         self.day)
+        for slottime in self.booking_type.slottime_set.filter(
+                start__lt=make_aware(datetime.datetime(2013, 5, 7),
+                                     get_current_timezone())):
+            slottime.status = SlotTime.STATUS.taken
+            slottime.save()
+        self.assertEqual(self.booking_type.get_next_free_day(self.day),
+                         self.day + timedelta(days=7))
+        self.assertIsNone(self.booking_type.get_next_free_day(
+            self.day + timedelta(days=8)))
+
+    def test_rebuild(self):
+        slottime = self.booking_type.slottime_set.order_by('start')[0]
+        SlotTime.objects.filter(pk=slottime.pk).update(
+            status=SlotTime.STATUS.taken)
+        DailyAvailability.objects.all().delete()
+        call_command('rebuild_daily_availability')
+        self.assertEqual(self.get_counters(),
+                         [(self.day, 3, 1),
+                          (self.day + timedelta(days=7), 4, 0)])
+
+
+class AvailabilityBitmapTest(TestCase):
+
+    def setUp(self):
+        # discard the changes of the bitmaps of the previous tests, whose
+        # transactions are never committed
+        run_commit_invalidations(committed=False)
+        cache.clear()
+        self.booking_type = BookingType30F()
+        # 6 may of 2013 is a monday
+        self.day = datetime.date(2013, 5, 6)
+        self.booking_type.dailyslottimepattern_set.create(
+            day=self.day.weekday(), start_time='9:00', end_time='11:00')
+        SlotTimesGeneration.objects.create(
+            booking_type=self.booking_type, start_date=self.day,
+            end_date=self.day + timedelta(days=7)).create_slot_times(
+            bulk=True)
+        run_commit_invalidations()
+
+    def at(self, hour, minute=0, days=0):
+        return make_aware(datetime.datetime.combine(
+            self.day + timedelta(days=days), datetime.time(hour, minute)),
+            get_current_timezone())
+
+    def test_get_availability_bitmap(self):
+        # 9:00, 9:30, 10:00 and 10:30 are the positions 18-21 of 30 minutes
+        bitmap = 0b1111 << 18
+        self.assertEqual(self.booking_type.get_availability_bitmap(self.day),
+                         (30, {6: bitmap, 13: bitmap}))
+        with self.assertNumQueries(0):
+            self.booking_type.get_availability_bitmap(self.day)
+
+    def test_lookups(self):
+        self.assertTrue(self.booking_type.has_free_slottimes(self.day))
+        self.assertFalse(self.booking_type.has_free_slottimes(
+            self.day + timedelta(days=1)))
+        self.assertEqual(
+            self.booking_type.get_free_slottimes_heatmap(self.day),
+            {self.day: 4, self.day + timedelta(days=7): 4})
+        self.assertEqual(
+            self.booking_type.get_earliest_free_start(self.at(9)),
+            self.at(9, 30))
+        self.assertEqual(
+            self.booking_type.get_earliest_free_start(self.at(10, 45)),
+            self.at(9, days=7))
+        self.assertIsNone(self.booking_type.get_earliest_free_start(
+            self.at(11, days=7), months=2))
+
+    def test_get_earliest_free_start_on_dst_day(self):
+        booking_type = BookingType30F()
+        # 2:30 is repeated on 27 october 2013 in Italy: the slot time starts
+        # at its first occurrence
+        slot_start = datetime.datetime(2013, 10, 27, 0, 30, tzinfo=utc)
+        SlotTime.objects.create(booking_type=booking_type, start=slot_start,
+                                end=slot_start + timedelta(minutes=30))
+        self.assertEqual(booking_type.get_earliest_free_start(
+            slot_start - timedelta(hours=3)), slot_start)
+
+    def test_taking_slottime_update_bitmap(self):
+        self.booking_type.get_availability_bitmap(self.day)
+        request = RequestFactory().get('/fake')
+        request.user = UserF()
+        Booking().save_and_take_slottime(
+            self.booking_type.slottime_set.order_by('start')[0], request)
+        # the bitmap is updated after the commit of the test transaction
+        self.assertEqual(
+            self.booking_type.get_free_slottimes_heatmap(self.day)[self.day],
+            4)
+        run_commit_invalidations()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.booking_type.get_earliest_free_start(self.at(0)),
+                self.at(9, 30))
+            self.assertEqual(
+                self.booking_type.get_free_slottimes_heatmap(self.day)[
+                    self.day], 3)
+
+    def test_rolled_back_booking_invalidate_bitmap(self):
+        self.booking_type.get_availability_bitmap(self.day)
+        request = RequestFactory().get('/fake')
+        request.user = UserF()
+        with patch.object(Booking, 'save', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                Booking().save_and_take_slottime(
+                    self.booking_type.slottime_set.order_by('start')[0],
+                    request)
+        run_commit_invalidations()
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                self.booking_type.get_free_slottimes_heatmap(self.day)[
+                    self.day], 4)
+
+    def test_pattern_change_invalidate_bitmap(self):
+        self.booking_type.get_availability_bitmap(self.day)
+        self.booking_type.dailyslottimepattern_set.create(
+            day=self.day.weekday(), start_time='15:15', end_time='16:15')
+        with self.assertNumQueries(2):
+            step, bitmaps = self.booking_type.get_availability_bitmap(
+                self.day)
+        self.assertEqual(step, 15)
+        self.assertEqual(bitmaps[6], 0b1010101 << 36)
+
+
 class SlotTimesGenerationModelTest(TestCase):
 
     def setUp(self):
@@ -156,9 +484,16 @@ class SlotTimesGenerationModelTest(TestCase):
         self.st_generation.end_date = self.start_date - timedelta(days=2)
         self.st_generation.save()
         self.assertRaises(ValueError, self.st_generation.create_slot_times)
+
+    def test_create_slot_times_method_across_years(self):
         self.st_generation.end_date = self.start_date + timedelta(days=500)
         self.st_generation.save()
-        self.assertRaises(ValueError, self.st_generation.create_slot_times)
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='10:00')
+        result, = self.st_generation.create_slot_times()
+        # 72 mondays from 6 may 2013 to 18 september 2014
+        self.assertEqual(result, 72 * 2)
 
     def test_create_slot_times_method_without_related_pattern(self):
         """
@@ -236,6 +571,172 @@ class SlotTimesGenerationModelTest(TestCase):
             slottime.booking_type = self.booking_type_30
             slottime.user = self.user
 
+    def test_bulk_create_slot_times_same_result_of_create_slot_times(self):
+        self.st_generation.end_date = self.start_date + timedelta(days=1)
+        self.st_generation.save()
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday() + 1, start_time='11:00',
+            end_time='13:00')
+        result, = self.st_generation.create_slot_times(bulk=True)
+        self.assertEqual(result, 8)
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 8)
+        self.assertEqual(
+            self.st_generation.slottime_set.filter(
+                user=self.user, status=SlotTime.STATUS.free).count(), 8)
+
+    def test_bulk_create_slot_times_skip_existing_slottimes(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        result, = self.st_generation.create_slot_times()
+        self.assertEqual(result, 4)
+        result, = self.st_generation.create_slot_times(bulk=True)
+        self.assertEqual(result, 0)
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 4)
+
+    def test_bulk_create_slot_times_skip_overlapping_slottimes(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:15',
+            end_time='10:15')
+        result, = self.st_generation.create_slot_times(bulk=True)
+        self.assertEqual(result, 4)
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 4)
+
+    def test_preview_slot_times(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.st_generation.create_slot_times(bulk=True)
+        for start_time, end_time in [('11:00', '12:00'), ('9:15', '10:15')]:
+            self.booking_type_30.dailyslottimepattern_set.create(
+                day=self.start_date.weekday(), start_time=start_time,
+                end_time=end_time)
+        # one query for the patterns, one for the closures and one for the
+        # existing slot times
+        with self.assertNumQueries(3):
+            result = self.st_generation.preview_slot_times()
+        self.assertEqual(result, {'total': 8, 'created': 2,
+                                  'duplicates': 4, 'overlaps': 2})
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 4)
+
+    def test_bulk_create_slot_times_in_chunks(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        with patch.object(SlotTime.objects, 'bulk_create') as mock_bulk:
+            result, = self.st_generation.create_slot_times(bulk=True,
+                                                           batch_size=3)
+        self.assertEqual(result, 4)
+        self.assertEqual(mock_bulk.call_count, 2)
+
+    def test_generate_store_progress_and_status(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.assertEqual(self.st_generation.generate(), 4)
+        generation = SlotTimesGeneration.objects.get(pk=self.st_generation.pk)
+        self.assertEqual(generation.status, SlotTimesGeneration.STATUS.done)
+        self.assertEqual(generation.slottimes_done, 4)
+        self.assertEqual(generation.slottimes_total, 4)
+        self.assertEqual(generation.errors, '')
+
+    def test_generate_store_errors(self):
+        self.assertIsNone(self.st_generation.generate())
+        generation = SlotTimesGeneration.objects.get(pk=self.st_generation.pk)
+        self.assertEqual(generation.status, SlotTimesGeneration.STATUS.failed)
+        self.assertIn('has no related DailySlotTimePattern', generation.errors)
+
+    def test_bulk_create_slot_times_call_progress_after_every_chunk(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        progress = Mock()
+        self.st_generation.bulk_create_slot_times(batch_size=3,
+                                                  progress=progress)
+        self.assertEqual(progress.mock_calls,
+                         [call(0, 4), call(3, 4), call(4, 4)])
+
+    @patch('celery.chord')
+    def test_queue(self, mock_chord):
+        SlotTimesGeneration.objects.filter(pk=self.st_generation.pk).update(
+            summary='4 slot times in 0.1s')
+        SlotTimesGeneration.objects.queue([self.st_generation])
+        self.assertEqual(mock_chord.call_count, 1)
+        generation = SlotTimesGeneration.objects.get(pk=self.st_generation.pk)
+        self.assertEqual(generation.status, SlotTimesGeneration.STATUS.queued)
+        self.assertEqual(generation.summary, '')
+
+    def test_generate_booking_type_slot_times_return_summary(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        summaries = generate_booking_type_slot_times([self.st_generation.pk])
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]['generation'], self.st_generation.pk)
+        self.assertEqual(summaries[0]['status'],
+                         SlotTimesGeneration.STATUS.done)
+        self.assertEqual(summaries[0]['count'], 4)
+        self.assertIn('seconds', summaries[0])
+
+    def test_summarize_slot_times_generations_store_summary(self):
+        self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        summaries = summarize_slot_times_generations(
+            [generate_booking_type_slot_times([self.st_generation.pk])])
+        self.assertEqual(
+            SlotTimesGeneration.objects.get(pk=self.st_generation.pk).summary,
+            '4 slot times in {0}s'.format(summaries[0]['seconds']))
+
+    def test_regenerate_slot_times_create_missing_slottimes(self):
+        pattern = self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.st_generation.create_slot_times()
+        pattern.end_time = '12:00'
+        pattern.save()
+        result = self.st_generation.regenerate_slot_times()
+        self.assertEqual(result, (2, 0))
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 6)
+
+    def test_regenerate_slot_times_delete_only_free_orphans(self):
+        pattern = self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='11:00')
+        self.st_generation.create_slot_times()
+        taken = self.booking_type_30.slottime_set.order_by('start')[0]
+        taken.status = SlotTime.STATUS.taken
+        taken.save()
+        pattern.start_time = '10:00'
+        pattern.end_time = '12:00'
+        pattern.save()
+        result = self.st_generation.regenerate_slot_times()
+        self.assertEqual(result, (2, 1))
+        self.assertEqual(self.booking_type_30.slottime_set.count(), 5)
+        self.assertTrue(SlotTime.objects.filter(pk=taken.pk).exists())
+        counters = DailyAvailability.objects.get(
+            booking_type=self.booking_type_30)
+        self.assertEqual((counters.free, counters.taken), (4, 1))
+
+    def test_regenerate_slot_times_not_overlap_taken_slottimes(self):
+        pattern = self.booking_type_30.dailyslottimepattern_set.create(
+            day=self.start_date.weekday(), start_time='9:00',
+            end_time='10:00')
+        self.st_generation.create_slot_times()
+        SlotTime.objects.update(status=SlotTime.STATUS.taken)
+        pattern.start_time = '9:15'
+        pattern.end_time = '10:45'
+        pattern.save()
+        result = self.st_generation.regenerate_slot_times()
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(SlotTime.free.count(), 1)
+
 
 class SlotTimeModelTest(TestCase):
 
@@ -271,10 +772,34 @@ class SlotTimeModelTest(TestCase):
         end = start + timedelta(minutes=30)
         slottime = SlotTime.objects.create(booking_type=bookingtype,
                                            start=start, end=end)
-        slottime_over = SlotTime()
+        slottime_over = SlotTime(booking_type=bookingtype)
         slottime_over.start = slottime.start + timedelta(minutes=15)
         slottime_over.end = slottime.end + timedelta(minutes=15)
         self.assertRaises(ValidationError, slottime_over.clean)
+        slottime_over.start = slottime.start - timedelta(minutes=15)
+        slottime_over.end = slottime.end - timedelta(minutes=15)
+        self.assertRaises(ValidationError, slottime_over.clean)
+
+    def test_clean_method_with_other_booking_type(self):
+        start = now()
+        end = start + timedelta(minutes=30)
+        SlotTime.objects.create(booking_type=self.booking_type_45,
+                                start=start, end=end)
+        slottime = SlotTime(booking_type=self.booking_type_30, start=start,
+                            end=end)
+        slottime.clean()
+
+    def test_clean_method_with_adjacent_slottimes(self):
+        bookingtype = BookingTypeF()
+        start = now()
+        end = start + timedelta(minutes=30)
+        slottime = SlotTime.objects.create(booking_type=bookingtype,
+                                           start=start, end=end)
+        SlotTime(booking_type=bookingtype, start=end,
+                 end=end + timedelta(minutes=30)).clean()
+        SlotTime(booking_type=bookingtype, start=start - timedelta(minutes=30),
+                 end=start).clean()
+        slottime.clean()
 
     def test_save_method(self):
         bookingtype = BookingTypeF()
@@ -282,7 +807,7 @@ class SlotTimeModelTest(TestCase):
         end = start + timedelta(minutes=30)
         slottime = SlotTime.objects.create(booking_type=bookingtype,
                                            start=start, end=end)
-        slottime_over = SlotTime()
+        slottime_over = SlotTime(booking_type=bookingtype)
         slottime_over.start = slottime.start + timedelta(minutes=15)
         slottime_over.end = slottime.end + timedelta(minutes=15)
         self.assertRaises(ValidationError, slottime_over.save)
@@ -342,6 +867,84 @@ class SlotTimeManagersTest(TestCase):
                          self.n_pre_slottimes - 1)
         self.assertEqual(SlotTime.taken.count(), 1)
 
+    def test_bulk_insert_skip_overlapping_slottimes(self):
+        booking_type = self.booking_types['30'][0]
+        existing = SlotTime.objects.filter(booking_type=booking_type)[0]
+        slottimes = [
+            SlotTime(booking_type=booking_type,
+                     start=existing.start + timedelta(minutes=15),
+                     end=existing.end + timedelta(minutes=15)),
+            SlotTime(booking_type=booking_type,
+                     start=existing.start - timedelta(days=1000),
+                     end=existing.end - timedelta(days=1000))]
+        with patch.object(SlotTime.objects, 'has_overlap_constraint',
+                          return_value=False):
+            self.assertEqual(
+                SlotTime.objects.bulk_insert(booking_type, slottimes), 1)
+        self.assertEqual(SlotTime.objects.count(), self.n_pre_slottimes + 1)
+        self.assertTrue(SlotTime.objects.filter(
+            booking_type=booking_type, start=slottimes[1].start).exists())
+
+    def test_bulk_insert_without_constraint_skip_overlapping_slottimes(self):
+        # the test database is created by syncdb, without the constraint
+        self.assertFalse(SlotTime.objects.has_overlap_constraint())
+        with self.assertNumQueries(0):
+            SlotTime.objects.has_overlap_constraint()
+        booking_type = self.booking_types['30'][0]
+        existing = SlotTime.objects.filter(booking_type=booking_type)[0]
+        slottime = SlotTime(booking_type=booking_type,
+                            start=existing.start + timedelta(minutes=15),
+                            end=existing.end + timedelta(minutes=15))
+        self.assertEqual(
+            SlotTime.objects.bulk_insert(booking_type, [slottime]), 0)
+        self.assertEqual(SlotTime.objects.count(), self.n_pre_slottimes)
+
+    def test_get_page_for_booking(self):
+        booking_type = self.booking_types['30'][0]
+        start = self.start_date - timedelta(days=2)
+        end = self.start_date + timedelta(days=40)
+        slottimes = list(SlotTime.free.filter(
+            booking_type=booking_type).order_by('start', 'pk'))
+        page, cursor = SlotTime.free.get_page_for_booking(
+            booking_type, start, end, limit=3)
+        self.assertEqual(page, slottimes[:3])
+        self.assertEqual(cursor, (slottimes[2].start, slottimes[2].pk))
+        with self.assertNumQueries(1):
+            page, cursor = SlotTime.free.get_page_for_booking(
+                booking_type, start, end, after=cursor, limit=3)
+        self.assertEqual(page, slottimes[3:6])
+        page, cursor = SlotTime.free.get_page_for_booking(
+            booking_type, start, end, after=cursor, limit=len(slottimes))
+        self.assertEqual(page, slottimes[6:])
+        self.assertIsNone(cursor)
+
+    def test_get_next_available(self):
+        booking_types = [booking_type for booking_type, result
+                         in self.booking_types.values()]
+        start, end = now(), now() + timedelta(days=40)
+        free = SlotTime.free.filter(
+            booking_type__in=booking_types, start__gt=start,
+            end__lt=end).order_by('start', 'booking_type')
+        with self.assertNumQueries(1):
+            slottimes = SlotTime.free.get_next_available(
+                booking_types, start, end, limit=5)
+        self.assertEqual(slottimes, list(free[:5]))
+        self.assertEqual(
+            set(slottime.booking_type_id for slottime in slottimes),
+            set(booking_type.pk for booking_type in booking_types))
+        slottimes[0].status = SlotTime.STATUS.taken
+        slottimes[0].save()
+        self.assertEqual(SlotTime.free.get_next_available(
+            booking_types, start, end, limit=5), list(free[:5]))
+
+    def test_get_nearest(self):
+        booking_type = self.booking_types['30'][0]
+        future = list(SlotTime.free.filter(
+            booking_type=booking_type, start__gt=now()).order_by('start'))
+        self.assertEqual(
+            SlotTime.free.get_nearest(booking_type, future[1].start, limit=2),
+            [future[0], future[2]])
+
 
 SERVER_EMAIL = 'serveremail@example.com'
 
@@ -439,3 +1042,62 @@ class BookingModelWithTransTest(TransactionTestCase):
         self.assertEqual(booking.booker, self.request.user)
         self.assertEqual(booking.slottime, self.slottime)
         self.assertEqual(booking.slottime.status, SlotTime.STATUS.taken)
+
+    def test_save_and_take_slottime_store_virtual_slottime(self):
+        start = self.slottime.end + timedelta(days=1)
+        slottime = SlotTime(booking_type=self.booking_type, start=start,
+                            end=start + timedelta(minutes=30))
+        booking = Booking()
+        booking.save_and_take_slottime(slottime, self.request)
+        self.assertIsNotNone(slottime.pk)
+        self.assertEqual(SlotTime.taken.get(), slottime)
+        self.assertEqual(Booking.objects.get().slottime, slottime)
+
+    def test_take_virtual_slottime_lock_booking_type(self):
+        start = self.slottime.end + timedelta(days=1)
+        slottime = SlotTime(booking_type=self.booking_type, start=start,
+                            end=start + timedelta(minutes=30))
+        with CaptureQueriesContext(connection) as context:
+            slottime.take()
+        queries = [query['sql'] for query in context.captured_queries]
+        lock = [i for i, sql in enumerate(queries) if 'FOR UPDATE' in sql]
+        overlaps = [i for i, sql in enumerate(queries) if sql.startswith(
+            'SELECT "nowait_slottime"."end"')]
+        # the booking type is locked before the overlap is checked again
+        self.assertEqual(len(lock), 1)
+        self.assertIn('nowait_bookingtype', queries[lock[0]])
+        self.assertTrue(overlaps and lock[0] < overlaps[0])
+        self.assertEqual(SlotTime.taken.get(), slottime)
+
+    def test_take_virtual_slottime_overlapping(self):
+        start = self.slottime.start + timedelta(minutes=15)
+        slottime = SlotTime(booking_type=self.booking_type, start=start,
+                            end=start + timedelta(minutes=30))
+        self.assertRaises(SlotTimeTaken, slottime.take)
+        self.assertEqual(SlotTime.objects.get(), self.slottime)
+
+    def test_take_virtual_slottime_with_constraint_no_lock(self):
+        start = self.slottime.end + timedelta(days=1)
+        slottime = SlotTime(booking_type=self.booking_type, start=start,
+                            end=start + timedelta(minutes=30))
+        with patch.object(SlotTime.objects, 'has_overlap_constraint',
+                          return_value=True), \
+                CaptureQueriesContext(connection) as context:
+            slottime.take()
+        self.assertFalse(any('FOR UPDATE' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_save_and_take_slottime_already_taken(self):
+        SlotTime.objects.filter(pk=self.slottime.pk).update(
+            status=SlotTime.STATUS.taken)
+        booking = Booking()
+        self.assertRaises(SlotTimeTaken, booking.save_and_take_slottime,
+                          self.slottime, self.request)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_take_succeed_only_once(self):
+        other = SlotTime.objects.get(pk=self.slottime.pk)
+        self.slottime.take()
+        self.assertEqual(self.slottime.status, SlotTime.STATUS.taken)
+        self.assertRaises(SlotTimeTaken, other.take)
+        self.assertEqual(SlotTime.taken.get(), self.slottime)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+from django.views.generic import View
+
+from ..models import BookingType, SlotTime
+from ..routers import (ReplicaReadMixin, ReplicaRouter, is_pinned,
+                       pin_primary, primary_reads, replica_reads)
+
+
+class ReadView(ReplicaReadMixin, View):
+
+    def get(self, request):
+        return HttpResponse(ReplicaRouter().db_for_read(SlotTime) or '')
+
+
+@override_settings(NOWAIT_READ_REPLICA='replica')
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_db_for_read(self):
+        self.assertIsNone(self.router.db_for_read(SlotTime))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(SlotTime), 'replica')
+            self.assertEqual(self.router.db_for_read(BookingType),
+                             'replica')
+            self.assertIsNone(self.router.db_for_read(User))
+            with primary_reads():
+                self.assertIsNone(self.router.db_for_read(SlotTime))
+            self.assertEqual(self.router.db_for_read(SlotTime), 'replica')
+        self.assertIsNone(self.router.db_for_read(SlotTime))
+
+    @override_settings(NOWAIT_READ_REPLICA='')
+    def test_db_for_read_without_replica(self):
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(SlotTime))
+
+    def test_db_for_write(self):
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_write(SlotTime))
+
+    def test_allow_syncdb(self):
+        self.assertFalse(self.router.allow_syncdb('replica', SlotTime))
+        self.assertIsNone(self.router.allow_syncdb('default', SlotTime))
+
+    def test_mixin_read_from_replica(self):
+        request = RequestFactory().get('/fake')
+        request.session = {}
+        self.assertEqual(ReadView.as_view()(request).content, b'replica')
+
+    def test_mixin_read_from_default_if_pinned(self):
+        request = RequestFactory().get('/fake')
+        request.session = {}
+        pin_primary(request)
+        self.assertTrue(is_pinned(request))
+        self.assertEqual(ReadView.as_view()(request).content, b'')
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import datetime
+
+from django.template import Context, Template
+from django.test import TestCase
+from django.utils.timezone import (timedelta, make_aware,
+                                   get_current_timezone)
+
+from .factories import BookingType30F
+from ..core import datetime_to_timestamp
+from ..models import SlotTime
+
+
+class SlottimeButtonsTest(TestCase):
+
+    def setUp(self):
+        self.booking_type = BookingType30F()
+        # 6 may of 2013 is a monday
+        self.start = make_aware(datetime.datetime(2013, 5, 6, 9),
+                                get_current_timezone())
+
+    def render(self, slottimes):
+        return Template(
+            '{% load nowait_tags %}{% slottime_buttons slottimes %}').render(
+            Context({'slottimes': slottimes}))
+
+    def test_stored_slottime(self):
+        slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=self.start,
+            end=self.start + timedelta(minutes=30))
+        html = self.render([slottime])
+        self.assertIn('href="{0}"'.format(slottime.get_booking_url()), html)
+        self.assertIn('id="btn_book_slottime_{0}"'.format(slottime.pk), html)
+        self.assertIn('title="Select slot time&nbsp;Monday 6 from 09:00 to'
+                      ' 09:30"', html)
+        self.assertIn('>Monday 6 from 09:00 to 09:30</a>', html)
+
+    def test_virtual_slottimes(self):
+        slottimes = [
+            SlotTime(booking_type=self.booking_type,
+                     start=self.start + timedelta(minutes=30 * i),
+                     end=self.start + timedelta(minutes=30 * (i + 1)))
+            for i in range(0, 3)]
+        html = self.render(slottimes)
+        self.assertEqual(html.count('<a '), 3)
+        for slottime in slottimes:
+            self.assertIn('href="{0}"'.format(slottime.get_booking_url()),
+                          html)
+            self.assertIn('id="btn_book_slottime_v{0}"'.format(
+                datetime_to_timestamp(slottime.start)), html)
@@ -1,22 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
+
 try:
     from unittest.mock import Mock, patch, ANY
 except ImportError:
     from mock import Mock, patch, ANY
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import localtime, now, timedelta
 from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
 
 from mezzanine.conf import settings
 
-from .factories import BookingType30F, UserF, RootNowaitPageF
+from .factories import BookingType30F, BookingType45F, UserF, RootNowaitPageF
+from ..core import datetime_to_timestamp
 from ..defaults import NOWAIT_ROOT_SLUG
-from ..models import SlotTime
+from ..models import SlotTime, SlotTimeTaken
+from ..routers import ReplicaRouter, is_pinned
 from ..utils import RequestMessagesTestMixin
-from ..views import BookingCreateView
+from ..views import (AVAILABILITY_ETAG_SECONDS, STREAMING_MARKER,
+                     BookingCreateView, SlottimeAvailabilityView,
+                     SlottimeNextAvailableView, SlottimeSelectView)
 
 
 class BookingTypeDetailViewTest(TestCase):
@@ -33,6 +41,16 @@ class BookingTypeDetailViewTest(TestCase):
         self.assertEqual(response.context['title'],
                          self.booking_type.title.title())
 
+    def test_next_free_day(self):
+        self.assertIsNone(self.client.get(self.url).context['next_free_day'])
+        start = now() + timedelta(days=2)
+        SlotTime.objects.create(booking_type=self.booking_type, start=start,
+                                end=start + timedelta(minutes=30))
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['next_free_day'],
+                         localtime(start).date())
+        self.assertContains(response, 'id="bookingtype_next_free_day"')
+
 
 class SlottimeSelectViewTest(TestCase):
 
@@ -43,6 +61,7 @@ class SlottimeSelectViewTest(TestCase):
         self.client.login(username=self.user.username,
                           password=self.user.username)
         self.root = RootNowaitPageF()
+        cache.clear()
 
     def test_get_view_with_wrong_booking_type_slug(self):
         response = self.client.get(self.url.format(slug='fake-slug'),
@@ -57,6 +76,267 @@ class SlottimeSelectViewTest(TestCase):
         self.assertEqual(response.context['title'],
                          'Select day and slot time')
 
+    def test_get_context_data_run_one_query(self):
+        start = now()
+        for days in range(2, 60, 5):
+            SlotTime.objects.create(
+                booking_type=self.booking_type,
+                start=start + timedelta(days=days),
+                end=start + timedelta(days=days, minutes=30))
+        view = SlottimeSelectView()
+        view.request = RequestFactory().get('/fake')
+        view.booking_type = self.booking_type
+        with self.assertNumQueries(1):
+            context = view.get_context_data()
+        self.assertEqual(
+            sum(len(slottimes) for (month, year), slottimes
+                in view.get_slottimes_by_month()), 12)
+        # only the slot times of the first month are rendered with the page
+        self.assertIsNotNone(context['slottimes'][0][2])
+        self.assertTrue(all(slottimes is None for month, year, slottimes, url
+                            in context['slottimes'][1:]))
+
+    @override_settings(NOWAIT_READ_REPLICA='replica')
+    def test_read_from_replica(self):
+        databases = []
+
+        def get_free_slottimes(start):
+            databases.append(ReplicaRouter().db_for_read(SlotTime))
+            return []
+
+        with patch.object(SlottimeSelectView, 'get_free_slottimes',
+                          side_effect=get_free_slottimes):
+            self.client.get(self.url.format(slug=self.booking_type.slug))
+        self.assertEqual(databases, ['replica'])
+
+    def test_month_view(self):
+        start = now() + timedelta(days=40)
+        slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=30))
+        local_start = localtime(start)
+        response = self.client.get(reverse(
+            'nowait:slottime_select_month',
+            kwargs={'slug': self.booking_type.slug,
+                    'year': local_start.year, 'month': local_start.month}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['slottimes'], [slottime])
+        self.assertContains(
+            response, 'id="btn_book_slottime_{0}"'.format(slottime.pk))
+        response = self.client.get(reverse(
+            'nowait:slottime_select_month',
+            kwargs={'slug': 'unknown', 'year': local_start.year,
+                    'month': local_start.month}))
+        self.assertEqual(response.status_code, 404)
+
+    @patch('nowait.views.settings.NOWAIT_SLOTTIME_SELECT_STREAMING', True,
+           create=True)
+    def test_streaming_response(self):
+        start = now()
+        slottimes = [
+            SlotTime.objects.create(
+                booking_type=self.booking_type,
+                start=start + timedelta(days=days),
+                end=start + timedelta(days=days, minutes=30))
+            for days in (2, 40)]
+        response = self.client.get(
+            self.url.format(slug=self.booking_type.slug))
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        # all the months are in the page, none is loaded on request
+        self.assertEqual(content.count('tab-pane fade'), 3)
+        self.assertNotIn('data-url', content)
+        self.assertNotIn(STREAMING_MARKER, content)
+        for slottime in slottimes:
+            self.assertIn('id="btn_book_slottime_{0}"'.format(slottime.pk),
+                          content)
+
+    @patch('nowait.views.settings.NOWAIT_SLOTTIME_SELECT_STREAMING', True,
+           create=True)
+    def test_streaming_response_without_marker(self):
+        start = now() + timedelta(days=2)
+        slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=30))
+        # as a template overridden without "streaming"
+        with patch('nowait.views.mark_safe', return_value=''):
+            response = self.client.get(
+                self.url.format(slug=self.booking_type.slug))
+        self.assertFalse(response.streaming)
+        self.assertContains(
+            response, 'id="btn_book_slottime_{0}"'.format(slottime.pk))
+
+    @override_settings(NOWAIT_READ_REPLICA='replica')
+    @patch('nowait.views.settings.NOWAIT_SLOTTIME_SELECT_STREAMING', True,
+           create=True)
+    def test_streaming_response_read_from_replica(self):
+        databases = []
+
+        def get_for_booking(*args, **kwargs):
+            databases.append(ReplicaRouter().db_for_read(SlotTime))
+            return SlotTime.objects.none()
+
+        with patch.object(SlotTime.free, 'get_for_booking',
+                          side_effect=get_for_booking):
+            response = self.client.get(
+                self.url.format(slug=self.booking_type.slug))
+            b''.join(response.streaming_content)
+        self.assertEqual(databases, ['replica'])
+
+    def test_get_context_data_use_availability_cache(self):
+        start = now() + timedelta(days=2)
+        slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=30))
+        view = SlottimeSelectView()
+        view.request = RequestFactory().get('/fake')
+        view.booking_type = self.booking_type
+        view.get_context_data()
+        with self.assertNumQueries(0):
+            context = view.get_context_data()
+        self.assertEqual(context['slottimes'][0][2], [slottime])
+        # taking the slot time invalidates the cache of its booking type
+        slottime.status = SlotTime.STATUS.taken
+        slottime.save()
+        with self.assertNumQueries(1):
+            context = view.get_context_data()
+        self.assertEqual(context['slottimes'], [])
+
+
+class SlottimeNextAvailableViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.booking_types = [BookingType30F(), BookingType45F()]
+        start = now() + timedelta(days=2)
+        self.slottimes = [
+            SlotTime.objects.create(
+                booking_type=booking_type,
+                start=start + timedelta(hours=i),
+                end=start + timedelta(hours=i, minutes=30))
+            for i, booking_type in enumerate(self.booking_types * 2)]
+        self.root = RootNowaitPageF()
+        self.url = reverse('nowait:slottime_next')
+
+    def test_get_with_booking_types(self):
+        response = self.client.get(self.url, {
+            'booking_type': [booking_type.slug
+                             for booking_type in self.booking_types],
+            'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['slottimes'], self.slottimes[:3])
+        self.assertEqual(response.context['title'],
+                         'First available slot times')
+
+    def test_get_with_calendar(self):
+        response = self.client.get(self.url, {
+            'calendar': self.booking_types[0].calendar_id})
+        self.assertEqual(response.context['slottimes'], self.slottimes)
+
+    def test_get_without_booking_types(self):
+        for params in [{}, {'booking_type': 'fake-slug'},
+                       {'calendar': 'x'}]:
+            response = self.client.get(self.url, params, follow=True)
+            self.assertRedirects(response, '/%s/' % NOWAIT_ROOT_SLUG)
+
+    def test_get_context_data_use_cache(self):
+        view = SlottimeNextAvailableView()
+        view.request = RequestFactory().get('/fake')
+        view.booking_types, view.limit = self.booking_types, 2
+        view.get_context_data()
+        with self.assertNumQueries(0):
+            context = view.get_context_data()
+        self.assertEqual(context['slottimes'], self.slottimes[:2])
+        # taking the slot time invalidates the cached value
+        self.slottimes[0].status = SlotTime.STATUS.taken
+        self.slottimes[0].save()
+        with self.assertNumQueries(1):
+            context = view.get_context_data()
+        self.assertEqual(context['slottimes'], self.slottimes[1:3])
+
+
+class SlottimeAvailabilityViewTest(TestCase):
+
+    def setUp(self):
+        self.booking_type = BookingType30F()
+        start = now() + timedelta(days=2)
+        self.slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=30))
+        self.url = reverse('nowait:slottime_availability',
+                           kwargs={'slug': self.booking_type.slug})
+
+    def test_get_free_slottimes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('ETag', response)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['booking_type'], self.booking_type.slug)
+        self.assertEqual(data['slottimes'], [
+            [datetime_to_timestamp(self.slottime.start), 30 * 60,
+             self.slottime.pk]])
+
+    def test_not_modified(self):
+        # without the middlewares, which make their own queries: only the
+        # site of the request and the booking type are read
+        view = SlottimeAvailabilityView.as_view()
+        etag = view(RequestFactory().get(self.url),
+                    slug=self.booking_type.slug)['ETag']
+        request = RequestFactory().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(2):
+            response = view(request, slug=self.booking_type.slug)
+        self.assertEqual(response.status_code, 304)
+        later = now() + timedelta(seconds=AVAILABILITY_ETAG_SECONDS)
+        request = RequestFactory().get(self.url, HTTP_IF_NONE_MATCH=etag)
+        with patch('django.utils.timezone.now', return_value=later):
+            response = view(request, slug=self.booking_type.slug)
+        self.assertEqual(response.status_code, 200)
+        self.slottime.status = SlotTime.STATUS.taken
+        self.slottime.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content.decode('utf-8'))['slottimes'], [])
+
+    def test_paginated(self):
+        start = self.slottime.start + timedelta(days=1)
+        slottime = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=30))
+        response = self.client.get(self.url, {'limit': 1})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([pk for ts, duration, pk in data['slottimes']],
+                         [self.slottime.pk])
+        response = self.client.get(self.url, {'limit': 1,
+                                              'after': data['next']})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([pk for ts, duration, pk in data['slottimes']],
+                         [slottime.pk])
+        self.assertIsNone(data['next'])
+        for params in [{'limit': 0}, {'limit': 'x'}, {'after': 'x'}]:
+            self.assertEqual(self.client.get(self.url, params).status_code,
+                             400)
+
+    @override_settings(NOWAIT_READ_REPLICA='replica')
+    def test_read_from_default(self):
+        databases = []
+
+        def get_page_for_booking(*args, **kwargs):
+            databases.append(ReplicaRouter().db_for_read(SlotTime))
+            return [], None
+
+        with patch.object(SlotTime.free, 'get_page_for_booking',
+                          side_effect=get_page_for_booking):
+            self.client.get(self.url, {'limit': 1})
+        self.assertEqual(databases, [None])
+
+    def test_wrong_window(self):
+        response = self.client.get(self.url, {'start': '2014-02-30'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'start': '2014-01-01',
+                                              'end': '2013-01-01'})
+        self.assertEqual(response.status_code, 400)
+
 
 class BookingCreateViewTest(RequestMessagesTestMixin, TestCase):
     def setUp(self):
@@ -92,6 +372,41 @@ class BookingCreateViewTest(RequestMessagesTestMixin, TestCase):
         self.assertRedirects(
             response, '/{page.slug}/'.format(page=self.root))
 
+    def test_redirect_in_dispacth_if_virtual_slottime_doesnt_exist(self):
+        self.booking_type.virtual_slottimes = True
+        self.booking_type.save()
+        response = self.client.get(
+            reverse('nowait:booking_create_virtual',
+                    kwargs={'slug': self.booking_type.slug,
+                            'timestamp': 2000000000}),
+            follow=True)
+        self.assertRedirects(
+            response, '/{page.slug}/'.format(page=self.root))
+
+    def test_redirect_in_dispacth_if_virtual_slottime_out_of_range(self):
+        self.booking_type.virtual_slottimes = True
+        self.booking_type.save()
+        response = self.client.get(
+            reverse('nowait:booking_create_virtual',
+                    kwargs={'slug': self.booking_type.slug,
+                            'timestamp': 10 ** 20}),
+            follow=True)
+        self.assertRedirects(
+            response, '/{page.slug}/'.format(page=self.root))
+
+    def test_virtual_slottime_object_is_in_context_data(self):
+        self.booking_type.virtual_slottimes = True
+        self.booking_type.save()
+        virtual_slottime = SlotTime(booking_type=self.booking_type,
+                                    start=self.slottime.start,
+                                    end=self.slottime.end)
+        with patch('nowait.views.BookingType.get_virtual_slottime',
+                   return_value=virtual_slottime):
+            response = self.client.get(virtual_slottime.get_booking_url())
+        self.assertEqual(response.context['slottime'], virtual_slottime)
+        self.assertEqual(response.context['form'].initial['slottime'],
+                         'virtual')
+
     def test_slottime_object_is_in_context_data(self):
         """
         Test that slottime object is in view context with key 'slottime'.
@@ -143,6 +458,23 @@ class BookingCreateViewTest(RequestMessagesTestMixin, TestCase):
         mock_messages.success.assert_called_once_with(
             request, self.mock_instance.success_message_on_creation)
 
+    @patch('nowait.views.messages')
+    @patch('django.forms.models.construct_instance', spec=True)
+    def test_on_form_valid_pin_session_to_primary(
+            self, mock_construct_instance, mock_messages):
+        """
+        Test that the session is pinned to the default database on
+        form_valid
+        """
+        factory = RequestFactory()
+        request = factory.post(self.url, self.data)
+        request.user = self.booker
+        request.session = {}
+        mock_construct_instance.return_value = self.mock_instance
+        BookingCreateView.as_view()(
+            request, **{'slottime_pk': self.slottime.pk})
+        self.assertTrue(is_pinned(request))
+
     @patch('nowait.views.messages')
     @patch('django.forms.models.construct_instance', spec=True)
     def test_on_form_valid_call_method_for_send_emais(
@@ -241,6 +573,31 @@ class BookingCreateViewTest(RequestMessagesTestMixin, TestCase):
             request, **{'slottime_pk': self.slottime.pk})
         self.assertEqual(getattr(response, 'url', response['Location']), '.')
 
+    @patch('nowait.views.messages')
+    @patch('django.forms.models.construct_instance', spec=True)
+    def test_on_form_slottime_taken_show_alternatives(
+            self, mock_construct_instance, mock_messages):
+        """
+        Test that a conflict response with the nearest free slot times is
+        returned if booking.save_and_take_slottime raise SlotTimeTaken.
+        """
+        start = self.slottime.end + timedelta(days=1)
+        alternative = SlotTime.objects.create(
+            booking_type=self.booking_type, start=start,
+            end=start + timedelta(minutes=self.booking_type.slot_length))
+        self.mock_instance.save_and_take_slottime.side_effect = (
+            SlotTimeTaken(self.slottime))
+        request = RequestFactory().post(self.url, self.data)
+        request.user = self.booker
+        mock_construct_instance.return_value = self.mock_instance
+        response = BookingCreateView.as_view()(
+            request, **{'slottime_pk': self.slottime.pk})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.template_name, 'nowait/slottime_taken.html')
+        self.assertEqual(response.context_data['alternatives'], [alternative])
+        mock_messages.warning.assert_called_once_with(request, ANY)
+        self.assertFalse(mock_messages.error.called)
+
 
 class HomeViewTest(TestCase):
 
@@ -5,7 +5,9 @@ from django.conf.urls import patterns, url
 from mezzanine.conf import settings
 
 from .views import (BookingCreateView, BookingDetailView, BookingListView,
-                    BookingTypeDetailView, HomeView, SlottimeSelectView)
+                    BookingTypeDetailView, HomeView, SlottimeAvailabilityView,
+                    SlottimeMonthView, SlottimeNextAvailableView,
+                    SlottimeSelectView)
 
 settings.use_editable()
 
@@ -18,8 +20,17 @@ urlpatterns = patterns(
         name='booking_detail'),
     url(r'^booking/create/(?P<slottime_pk>\d+)/$', BookingCreateView.as_view(),
         name='booking_create'),
+    url(r'^booking/create/(?P<slug>[-_\w]+)/(?P<timestamp>\d+)/$',
+        BookingCreateView.as_view(), name='booking_create_virtual'),
+    url(r'^slottime/next/$', SlottimeNextAvailableView.as_view(),
+        name='slottime_next'),
     url(r'^(?P<slug>[-_\w]+)/$', BookingTypeDetailView.as_view(),
         name='bookingtype_detail'),
     url(r'^(?P<slug>[-_\w]+)/slottime/select/$', SlottimeSelectView.as_view(),
         name='slottime_select'),
+    url(r'^(?P<slug>[-_\w]+)/slottime/select/(?P<year>\d{4})/'
+        r'(?P<month>\d{1,2})/$', SlottimeMonthView.as_view(),
+        name='slottime_select_month'),
+    url(r'^(?P<slug>[-_\w]+)/slottime/availability\.json$',
+        SlottimeAvailabilityView.as_view(), name='slottime_availability'),
 )
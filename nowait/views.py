@@ -1,26 +1,53 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import hashlib
+import itertools
+import json
 import logging
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.shortcuts import redirect
-from django.utils import timezone
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils import timezone, translation
+from django.utils.decorators import method_decorator
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
+from django.views.decorators.http import etag
 from django.views.generic import (DetailView, ListView, TemplateView,
-                                  RedirectView)
+                                  RedirectView, View)
 from django.views.generic.edit import FormView
 
 from mezzanine.conf import settings
 
 from braces.views import LoginRequiredMixin
 
+from .cache import (get_availability, get_combined_availability,
+                    get_version)
+from .core import datetime_to_timestamp, timestamp_to_datetime
+from .routers import (ReplicaReadMixin, is_replica_reads, pin_primary,
+                      replica_reads)
 from .utils import PageContextTitleMixin, get_root_app_page
-from .models import Booking, BookingType, SlotTime
+from .models import Booking, BookingType, SlotTime, SlotTimeTaken
 from .forms import BookingCreateForm
 
+AVAILABILITY_DAYS = 95
+MAX_AVAILABILITY_DAYS = 366
+MAX_PAGED_AVAILABILITY_DAYS = 5 * 366
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# the slot times starting meanwhile are still listed by a response valid
+# for at most these seconds
+AVAILABILITY_ETAG_SECONDS = 300
+NEXT_AVAILABLE_LIMIT = 10
+STREAMING_MARKER = '<!-- nowait:slottime-sections -->'
+MAX_NEXT_AVAILABLE_LIMIT = 50
+
 
 class HomeView(RedirectView):
     permanent = False
@@ -31,14 +58,27 @@ class HomeView(RedirectView):
             slug=settings.NOWAIT_ROOT_SLUG.lstrip('/').rstrip('/'))
 
 
-class BookingTypeDetailView(PageContextTitleMixin, DetailView):
+class BookingTypeDetailView(ReplicaReadMixin, PageContextTitleMixin,
+                            DetailView):
     model = BookingType
 
     def get_page_title(self):
         return _('%(title)s') % {'title': self.object.title.title()}
 
+    def get_context_data(self, **kwargs):
+        """
+        Update the context with "next_free_day", the first day from today
+        with free slot times or None.
+        """
+        context = super(BookingTypeDetailView, self).get_context_data(
+            **kwargs)
+        context['next_free_day'] = self.object.get_next_free_day(
+            timezone.localtime(timezone.now()).date())
+        return context
+
 
-class SlottimeSelectView(PageContextTitleMixin, TemplateView):
+class SlottimeSelectView(ReplicaReadMixin, PageContextTitleMixin,
+                         TemplateView):
     template_name = 'nowait/slottime_select.html'
     page_title = _('Select day and slot time')
     booking_type = None
@@ -49,28 +89,392 @@ class SlottimeSelectView(PageContextTitleMixin, TemplateView):
                 slug=kwargs['slug'])
         except BookingType.DoesNotExist:
             return redirect(reverse('nowait:home'))
+        if settings.NOWAIT_SLOTTIME_SELECT_STREAMING:
+            return self.get_streaming_response(**kwargs)
         return super(SlottimeSelectView, self).get(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        context = super(SlottimeSelectView, self).get_context_data(**kwargs)
+    def get_start(self):
+        """
+        Return the aware datetime the slot times are shown from, the first
+        minute of today.
+        """
         now = timezone.now()
-        start = timezone.make_aware(
+        return timezone.make_aware(
             datetime(now.year, now.month, now.day, 0, 1),
             timezone.get_current_timezone())
-        slottimes = SlotTime.free.get_for_booking(self.booking_type,
-                                                  start=start)
-        context['slottimes'] = []
-        for month, year in [
+
+    def get_months(self, start):
+        """
+        Return the list of (month, year) of the months shown from start.
+        """
+        return [
             (start.month + i, start.year) if start.month + i <= 12
             else ((start.month + i) % 12, start.year + 1) for i in range(0,
-                                                                         3)]:
-            qs = slottimes.filter(start__month=month, start__year=year)
-            if len(qs) > 0:
-                context['slottimes'].append(
-                    ('{0:%B}'.format(qs[0].start), year, qs))
+                                                                         3)]
+
+    def get_free_slottimes(self, start):
+        """
+        Return the list of (pk, start, end) of the free slot times of
+        self.booking_type shown from start.
+        """
+        if self.booking_type.virtual_slottimes:
+            slottimes = SlotTime.free.get_virtual_for_booking(
+                self.booking_type, start=start)
+        else:
+            # only the fields used by the template
+            slottimes = SlotTime.free.get_for_booking(
+                self.booking_type, start=start).only('id', 'start', 'end')
+        return [(slottime.pk, slottime.start, slottime.end)
+                for slottime in slottimes]
+
+    def get_slottimes_by_month(self):
+        """
+        Return the list of ((month, year), [(pk, start, end), ...]) of the
+        months shown with free slot times of self.booking_type, read from the
+        availability cache.
+        """
+        start = self.get_start()
+        months = self.get_months(start)
+        by_month = {}
+        for slottime in get_availability(
+                self.booking_type.pk, start.date().isoformat(),
+                lambda: self.get_free_slottimes(start)):
+            local_start = timezone.localtime(slottime[1])
+            by_month.setdefault((local_start.month, local_start.year),
+                                []).append(slottime)
+        return [(key, by_month[key]) for key in months if key in by_month]
+
+    def get_slottimes(self, slottimes):
+        """
+        Return the SlotTime instances of the (pk, start, end) in slottimes.
+        """
+        return [SlotTime(id=pk, booking_type=self.booking_type,
+                         start=slot_start, end=slot_end)
+                for pk, slot_start, slot_end in slottimes]
+
+    def get_context_data(self, **kwargs):
+        """
+        Update the context with "slottimes", the list of (month, year,
+        slottimes, url) of the months shown. Only the slot times of the
+        first month are rendered with the page, the ones of the other months
+        are None and are loaded from url when their tab is opened.
+        """
+        context = super(SlottimeSelectView, self).get_context_data(**kwargs)
+        context['slottimes'] = [
+            ('{0:%B}'.format(date(year, month, 1)), year,
+             self.get_slottimes(slottimes) if i == 0 else None,
+             reverse('nowait:slottime_select_month', kwargs={
+                 'slug': self.booking_type.slug, 'year': year,
+                 'month': month}))
+            for i, ((month, year), slottimes) in enumerate(
+                self.get_slottimes_by_month())]
+        return context
+
+    def get_streaming_response(self, **kwargs):
+        """
+        Return a StreamingHttpResponse that sends at once the page rendered
+        without the sections of the months and then the sections, rendered
+        one month at a time while the slot times are read from the database
+        with iterator(), bypassing the availability cache: neither the page
+        nor the slot times are ever whole in memory.
+
+        If the rendered page doesn't contain STREAMING_MARKER once, as with
+        a template overridden without "streaming", the page is rendered
+        whole instead.
+        """
+        start = self.get_start()
+        months = self.get_months(start)
+        context = super(SlottimeSelectView, self).get_context_data(**kwargs)
+        # a template without the marker renders the months as the
+        # non-streaming page, without slot times
+        context['slottimes'] = [
+            ('{0:%B}'.format(date(year, month, 1)), year,
+             [] if i == 0 else None,
+             reverse('nowait:slottime_select_month', kwargs={
+                 'slug': self.booking_type.slug, 'year': year,
+                 'month': month}))
+            for i, (month, year) in enumerate(months)]
+        context['streaming'] = mark_safe(STREAMING_MARKER)
+        response = self.render_to_response(context)
+        response.render()
+        parts = response.content.split(
+            STREAMING_MARKER.encode(settings.DEFAULT_CHARSET))
+        if len(parts) != 2:
+            logger = logging.getLogger('nowait')
+            logger.warning(
+                'Template %s without the streaming marker, the slot time '
+                'selection is not streamed', self.template_name)
+            return super(SlottimeSelectView, self).get(self.request,
+                                                       **kwargs)
+        head, tail = parts
+        return StreamingHttpResponse(
+            itertools.chain([head], self.iter_sections(
+                start, months, translation.get_language(),
+                timezone.get_current_timezone(), is_replica_reads()),
+                [tail]),
+            content_type=response['Content-Type'])
+
+    def iter_sections(self, start, months, language, tz, replica=False):
+        """
+        Iterate over the rendered sections of months, with the free slot
+        times of self.booking_type from start.
+
+        The sections are rendered after the middlewares have processed the
+        response, out of dispatch: language, tz and replica (the slot times
+        are read from the read replica) are the ones of the request.
+        """
+        with translation.override(language), timezone.override(tz), \
+                replica_reads(enabled=replica):
+            for section in self._iter_sections(start, months):
+                yield section
+
+    def _iter_sections(self, start, months):
+        if self.booking_type.virtual_slottimes:
+            slottimes = SlotTime.free.get_virtual_for_booking(
+                self.booking_type, start=start)
+        else:
+            slottimes = SlotTime.free.get_for_booking(
+                self.booking_type, start=start).only(
+                'id', 'start', 'end').iterator()
+        groups = itertools.groupby(slottimes, key=lambda slottime: (
+            timezone.localtime(slottime.start).month,
+            timezone.localtime(slottime.start).year))
+        group = next(groups, None)
+        for counter, key in enumerate(months, 1):
+            month_slottimes = []
+            if group is not None and group[0] == key:
+                month_slottimes = list(group[1])
+                group = next(groups, None)
+            yield render_to_string('nowait/slottime_select_section.html', {
+                'slottimes': month_slottimes, 'counter': counter,
+                'active': counter == 1})
+
+
+class SlottimeMonthView(SlottimeSelectView):
+    """
+    HTML fragment with the free slot times of a month of the slot time
+    selection page, loaded when the tab of the month is opened.
+    """
+    template_name = 'nowait/slottime_select_month.html'
+
+    def get(self, request, *args, **kwargs):
+        self.booking_type = get_object_or_404(BookingType,
+                                              slug=kwargs['slug'])
+        return super(SlottimeSelectView, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(SlottimeSelectView, self).get_context_data(**kwargs)
+        slottimes = dict(self.get_slottimes_by_month()).get(
+            (int(kwargs['month']), int(kwargs['year'])), [])
+        context['slottimes'] = self.get_slottimes(slottimes)
+        return context
+
+
+class SlottimeNextAvailableView(ReplicaReadMixin, PageContextTitleMixin,
+                                TemplateView):
+    """
+    The first free slot times of a set of equivalent booking types, given
+    with the "booking_type" GET parameter (one slug for every booking type)
+    or with the "calendar" GET parameter (all the booking types of the
+    calendar with that id). The "limit" GET parameter sets how many are
+    shown.
+    """
+    template_name = 'nowait/slottime_next.html'
+    page_title = _('First available slot times')
+    booking_types = None
+    limit = NEXT_AVAILABLE_LIMIT
+
+    def get(self, request, *args, **kwargs):
+        if 'calendar' in request.GET:
+            booking_types = (
+                BookingType.objects.filter(calendar=request.GET['calendar'])
+                if request.GET['calendar'].isdigit()
+                else BookingType.objects.none())
+        else:
+            booking_types = BookingType.objects.filter(
+                slug__in=request.GET.getlist('booking_type'))
+        self.booking_types = list(booking_types)
+        if not self.booking_types:
+            return redirect(reverse('nowait:home'))
+        try:
+            self.limit = int(request.GET.get('limit', NEXT_AVAILABLE_LIMIT))
+        except ValueError:
+            return HttpResponseBadRequest('Wrong limit')
+        self.limit = max(1, min(self.limit, MAX_NEXT_AVAILABLE_LIMIT))
+        return super(SlottimeNextAvailableView, self).get(request, *args,
+                                                          **kwargs)
+
+    def get_next_available(self, start):
+        """
+        Return the list of (pk, booking type id, start, end) of the first
+        free slot times of self.booking_types after start.
+        """
+        return [(slottime.pk, slottime.booking_type_id, slottime.start,
+                 slottime.end)
+                for slottime in SlotTime.free.get_next_available(
+                    self.booking_types, start,
+                    start + timedelta(days=MAX_AVAILABILITY_DAYS),
+                    limit=self.limit)]
+
+    def get_context_data(self, **kwargs):
+        context = super(SlottimeNextAvailableView, self).get_context_data(
+            **kwargs)
+        # the start is rounded to the minute, so the cached value is shared
+        # by the requests of the same minute
+        start = timezone.now().replace(second=0, microsecond=0)
+        booking_types = dict((booking_type.pk, booking_type)
+                             for booking_type in self.booking_types)
+        context['slottimes'] = [
+            SlotTime(id=pk, booking_type=booking_types[booking_type_id],
+                     start=slot_start, end=slot_end)
+            for pk, booking_type_id, slot_start, slot_end in
+            get_combined_availability(
+                booking_types.keys(), 'next:{0}:{1:%Y%m%d%H%M}'.format(
+                    self.limit, start),
+                lambda: self.get_next_available(start),
+                settings.NOWAIT_NEXT_AVAILABLE_CACHE_TIMEOUT)]
         return context
 
 
+def _get_availability_window(request, max_days=MAX_AVAILABILITY_DAYS):
+    """
+    Return the aware datetimes of start and end of the window of days
+    requested with the "start" and "end" GET parameters (YYYY-MM-DD, both
+    included). By default the window starts today and lasts
+    AVAILABILITY_DAYS days.
+
+    :raise ValueError: if the parameters aren't valid dates or the window is
+                       empty or longer than max_days days
+    """
+    tz = timezone.get_current_timezone()
+    start_date = (datetime.strptime(request.GET['start'], '%Y-%m-%d')
+                  if 'start' in request.GET else timezone.localtime(
+                      timezone.now()).replace(tzinfo=None))
+    end_date = (datetime.strptime(request.GET['end'], '%Y-%m-%d')
+                if 'end' in request.GET else
+                start_date + timedelta(days=AVAILABILITY_DAYS - 1))
+    start = timezone.make_aware(
+        datetime.combine(start_date.date(), time()), tz)
+    end = timezone.make_aware(
+        datetime.combine(end_date.date() + timedelta(days=1), time()), tz)
+    if not start < end <= start + timedelta(days=max_days):
+        raise ValueError('Wrong availability window')
+    return start, end
+
+
+def _encode_cursor(cursor):
+    """
+    Return the string of the (start, id) cursor of a page of slot times:
+    the start in microseconds from the epoch and the id, if any.
+    """
+    start, pk = cursor
+    value = '{0}'.format(datetime_to_timestamp(start) * 10 ** 6 +
+                         start.microsecond)
+    return value if pk is None else '{0}.{1}'.format(value, pk)
+
+
+def _decode_cursor(value):
+    """
+    Return the (start, id) cursor of the string value made by
+    _encode_cursor.
+
+    :raise ValueError: if value isn't a valid cursor
+    """
+    start, _sep, pk = value.partition('.')
+    seconds, microseconds = divmod(int(start), 10 ** 6)
+    try:
+        start = timestamp_to_datetime(seconds, timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError('Wrong cursor')
+    return start.replace(microsecond=microseconds), int(pk) if pk else None
+
+
+def _get_availability_booking_type(request, slug):
+    """
+    Return the booking type of slug, fetched once for request.
+    """
+    if not hasattr(request, '_nowait_availability_booking_type'):
+        request._nowait_availability_booking_type = get_object_or_404(
+            BookingType, slug=slug)
+    return request._nowait_availability_booking_type
+
+
+def _availability_etag(request, slug):
+    booking_type = _get_availability_booking_type(request, slug)
+    # the version of the availability cache changes with every change of
+    # slot times, patterns and closures; the window starts at the current
+    # time, so the ETag changes every AVAILABILITY_ETAG_SECONDS too
+    return hashlib.md5('{0}:{1}:{2}:{3}'.format(
+        booking_type.pk, get_version(booking_type.pk),
+        datetime_to_timestamp(timezone.now()) // AVAILABILITY_ETAG_SECONDS,
+        request.GET.urlencode()).encode('utf-8')).hexdigest()
+
+
+class SlottimeAvailabilityView(View):
+    """
+    Read-only JSON of the free slot times of a booking type in a window of
+    days, for clients polling availability::
+
+        {"booking_type": "<slug>",
+         "slottimes": [[<start POSIX timestamp>, <duration in seconds>,
+                        <id or null for virtual slot times>], ...]}
+
+    With the "limit" or "after" GET parameters the slot times are paginated
+    by cursor: the response has at most "limit" slot times (PAGE_SIZE by
+    default) and "next", the cursor to pass as "after" to get the next page
+    or null on the last one. The window can then be as long as
+    MAX_PAGED_AVAILABILITY_DAYS days.
+
+    The ETag is derived from the version of the availability cache of the
+    booking type, so unchanged availability is answered with a 304 after
+    the query of the booking type. The version changes as soon as the
+    default database is written, so the slot times are read from it and
+    never from the read replica.
+    """
+    http_method_names = ['get', 'head']
+
+    @method_decorator(etag(_availability_etag))
+    def get(self, request, slug):
+        booking_type = _get_availability_booking_type(request, slug)
+        paginated = 'limit' in request.GET or 'after' in request.GET
+        try:
+            start, end = _get_availability_window(
+                request, MAX_PAGED_AVAILABILITY_DAYS if paginated
+                else MAX_AVAILABILITY_DAYS)
+            if paginated:
+                limit = int(request.GET.get('limit', PAGE_SIZE))
+                if not 0 < limit <= MAX_PAGE_SIZE:
+                    raise ValueError('Wrong limit')
+                after = (_decode_cursor(request.GET['after'])
+                         if 'after' in request.GET else None)
+        except ValueError as e:
+            return HttpResponseBadRequest('%s' % e)
+        start = max(start, timezone.now())
+        data = {'booking_type': booking_type.slug}
+        if paginated:
+            page, cursor = SlotTime.free.get_page_for_booking(
+                booking_type, start, end, after=after, limit=limit)
+            slottimes = [(slottime.pk, slottime.start, slottime.end)
+                         for slottime in page]
+            data['next'] = _encode_cursor(cursor) if cursor else None
+        elif booking_type.virtual_slottimes:
+            slottimes = [(None, slottime.start, slottime.end)
+                         for slottime in booking_type.get_virtual_slottimes(
+                             start, end)]
+        else:
+            slottimes = SlotTime.free.filter(
+                booking_type=booking_type, start__gt=start,
+                end__lt=end).order_by('start').values_list(
+                'id', 'start', 'end')
+        data['slottimes'] = [
+            [datetime_to_timestamp(slot_start),
+             datetime_to_timestamp(slot_end) -
+             datetime_to_timestamp(slot_start), pk]
+            for pk, slot_start, slot_end in slottimes]
+        return HttpResponse(json.dumps(data, separators=(',', ':')),
+                            content_type='application/json')
+
+
 class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
     form_class = BookingCreateForm
     http_method_names = ['get', 'post']
@@ -80,11 +484,18 @@ class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
 
     def dispatch(self, request, *args, **kwargs):
         try:
-            self.slottime = SlotTime.objects.get(
-                pk=kwargs['slottime_pk'])
+            if 'timestamp' in kwargs:
+                self.slottime = BookingType.objects.get(
+                    slug=kwargs['slug'], virtual_slottimes=True
+                ).get_virtual_slottime(kwargs['timestamp'])
+                if self.slottime is None:
+                    raise SlotTime.DoesNotExist
+            else:
+                self.slottime = SlotTime.objects.get(
+                    pk=kwargs['slottime_pk'])
             return super(BookingCreateView, self).dispatch(
                 request, *args, **kwargs)
-        except SlotTime.DoesNotExist:
+        except (SlotTime.DoesNotExist, BookingType.DoesNotExist):
             return redirect('/{page.slug}/'.format(
                 page=get_root_app_page(SlotTime._meta.app_label)))
 
@@ -94,7 +505,7 @@ class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
         return context
 
     def get_initial(self):
-        return {'slottime': self.slottime.pk}
+        return {'slottime': self.slottime.pk or 'virtual'}
 
     def get_success_url(self):
         return reverse('nowait:booking_list')
@@ -104,6 +515,11 @@ class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
         booking = form.instance
         try:
             booking.save_and_take_slottime(self.slottime, self.request)
+        except SlotTimeTaken:
+            messages.warning(self.request, _(
+                'Sorry. The slot time selected has just been taken, please'
+                ' choose another one.'))
+            return self.get_slottime_taken_response()
         except Exception as e:
             msg_on_error = _('Sorry. An error is occured. Please try again'
                              ' later.')
@@ -115,6 +531,8 @@ class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
                                         'request': self.request})
             return redirect('.')
         else:
+            # the next pages of the user read their own booking
+            pin_primary(self.request)
             settings.use_editable()
             messages.success(self.request,
                              booking.success_message_on_creation)
@@ -122,6 +540,21 @@ class BookingCreateView(LoginRequiredMixin, PageContextTitleMixin, FormView):
             print("********", settings.NOWAIT_CALENDAR_TASK_ENABLE)
         return result
 
+    def get_slottime_taken_response(self):
+        """
+        Return the response, with status 409, to the booking of a slot time
+        taken meanwhile: it offers the nearest free slot times of the same
+        booking type.
+        """
+        booking_type = self.slottime.booking_type
+        return TemplateResponse(
+            self.request, 'nowait/slottime_taken.html',
+            {'title': _('Slot time already taken'),
+             'booking_type': booking_type, 'slottime': self.slottime,
+             'alternatives': SlotTime.free.get_nearest(
+                 booking_type, self.slottime.start)},
+            status=409)
+
 
 class BookingListView(PageContextTitleMixin, LoginRequiredMixin, ListView):
     context_object_name = 'booking_list'